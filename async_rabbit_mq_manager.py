@@ -0,0 +1,103 @@
+import asyncio
+import inspect
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, List, Optional
+
+from rabbit_mq_manager import BatchResult, QueueConfig, RabbitMQManager
+
+
+class AsyncRabbitMQManager:
+    """
+    asyncio front end for RabbitMQManager with the same surface.
+
+    Blocking pika calls run on a dedicated pool of I/O threads (one per pooled
+    connection by default) and are awaited as futures, so the event loop never
+    waits on a broker round trip. Many publishes can be awaited concurrently;
+    each consumer runs on its own thread and hands messages back to the loop.
+    """
+
+    def __init__(self, rabbitmq_manager: Optional[RabbitMQManager] = None,
+                 io_threads: Optional[int] = None, **manager_kwargs):
+        """
+        Args:
+            rabbitmq_manager: Manager to wrap; one is created from manager_kwargs if omitted
+            io_threads: Number of I/O threads for publishes and declarations
+                (defaults to the connection pool size)
+        """
+        self.manager = rabbitmq_manager or RabbitMQManager(**manager_kwargs)
+        self._executor = ThreadPoolExecutor(
+            max_workers=io_threads or self.manager._pool.size,
+            thread_name_prefix='rabbitmq-io'
+        )
+        self.logger = logging.getLogger(__name__)
+
+    async def _run(self, func: Callable, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def create_queue(self, queue_config: QueueConfig) -> bool:
+        return await self._run(self.manager.create_queue, queue_config)
+
+    async def declare_topology(self, queue_configs: List[QueueConfig]) -> bool:
+        return await self._run(self.manager.declare_topology, queue_configs)
+
+    async def publish_message(self, queue_id: str, message: Any) -> bool:
+        return await self._run(self.manager.publish_message, queue_id, message)
+
+    async def publish_batch(self, queue_id: str, messages: List[Any], **kwargs) -> BatchResult:
+        return await self._run(self.manager.publish_batch, queue_id, messages, **kwargs)
+
+    async def subscribe_to_queue(self, queue_id: str, user_id: str, session_id: str,
+                                 live_only: bool = False) -> bool:
+        return await self._run(self.manager.subscribe_to_queue, queue_id, user_id, session_id, live_only)
+
+    async def delete_queue(self, queue_id: str) -> bool:
+        return await self._run(self.manager.delete_queue, queue_id)
+
+    async def consume_messages(self, queue_id: str, callback, user_id: str, session_id: str,
+                               **consume_options) -> None:
+        """
+        Consume messages from a user session-specific queue until cancelled.
+
+        The callback may be a plain function or a coroutine function; it is
+        always run on the event loop. Each message is acknowledged only after
+        its callback has finished, as with the blocking manager. Extra keyword
+        arguments (prefetch_count, batch_size, ...) are passed on to
+        RabbitMQManager.consume_messages.
+        """
+        loop = asyncio.get_running_loop()
+        stop_event = threading.Event()
+        finished = loop.create_future()
+
+        async def invoke(message):
+            result = callback(message)
+            if inspect.isawaitable(result):
+                await result
+
+        def on_message(message):
+            # Runs on the consumer thread: hand the message to the loop and wait for it
+            asyncio.run_coroutine_threadsafe(invoke(message), loop).result()
+
+        def run():
+            try:
+                self.manager.consume_messages(queue_id, on_message, user_id=user_id,
+                                              session_id=session_id, stop_event=stop_event,
+                                              **consume_options)
+            finally:
+                loop.call_soon_threadsafe(lambda: finished.done() or finished.set_result(None))
+
+        threading.Thread(target=run, name=f"rabbitmq-consumer-{queue_id}", daemon=True).start()
+        try:
+            await asyncio.shield(finished)
+        except asyncio.CancelledError:
+            stop_event.set()
+            await finished
+            raise
+
+    async def close(self) -> None:
+        """Wait for in-flight operations, then close all pooled connections"""
+        await asyncio.get_running_loop().run_in_executor(None, self._executor.shutdown)
+        self.manager.close()
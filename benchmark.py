@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+End-to-end throughput and latency benchmarks for RabbitMQManager and RedisManager.
+
+Runs against the in-process FakeBroker by default, or a local RabbitMQ with
+--broker rabbitmq. Redis scenarios need a reachable Redis server and are
+reported as skipped otherwise. Results are printed (or written) as JSON so
+runs can be compared between versions:
+
+    python benchmark.py --messages 5000 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, UTC
+from typing import Dict, List, Optional
+
+from consumer import MessageConsumer
+from fake_broker import FakeBroker
+from rabbit_mq_manager import REPLAY_QUEUE, REPLAY_STREAM, QueueConfig, RabbitMQManager
+from session_checkpoint import SessionCheckpointStore
+
+
+def percentile(samples: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of the samples"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(name: str, params: Dict, messages: int, seconds: float,
+              latencies: List[float], bytes_per_message: Optional[int]) -> Dict:
+    """Build one scenario result; latencies are in seconds and reported in milliseconds"""
+    def ms(value: Optional[float]) -> Optional[float]:
+        return None if value is None else round(value * 1000, 4)
+
+    return {
+        'scenario': name,
+        'params': params,
+        'messages': messages,
+        'seconds': round(seconds, 4),
+        'msgs_per_sec': round(messages / seconds, 1) if seconds > 0 else None,
+        'latency_ms': {
+            'p50': ms(percentile(latencies, 0.50)),
+            'p99': ms(percentile(latencies, 0.99)),
+            'p999': ms(percentile(latencies, 0.999)),
+        },
+        'bytes_per_message': bytes_per_message,
+    }
+
+
+def make_payload(index: int) -> Dict:
+    return {
+        'order_id': f"ORD-{index % 9000 + 1000}",
+        'customer_id': f"CUST-{index % 900 + 100}",
+        'amount': round(10.0 + index % 990, 2),
+        'items': index % 10 + 1,
+        'sent_at': time.perf_counter(),
+    }
+
+
+class RabbitMQBenchmarks:
+    """Scenarios for RabbitMQManager; every scenario runs on fresh queues"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.broker = FakeBroker(latency=args.latency) if args.broker == 'fake' else None
+        self._run_id = 0
+
+    def manager(self, **kwargs) -> RabbitMQManager:
+        if self.broker is not None:
+            kwargs['connection_factory'] = self.broker.connect
+        kwargs.setdefault('bind_main_queue', self.args.bind_main_queue)
+        return RabbitMQManager(host=self.args.host, port=self.args.port, username=self.args.username,
+                               password=self.args.password, pool_size=self.args.pool_size, **kwargs)
+
+    def queue_name(self, scenario: str) -> str:
+        self._run_id += 1
+        return f"bench_{scenario}_{os.getpid()}_{self._run_id}"
+
+    def bytes_per_message(self, manager: RabbitMQManager, queue_id: str) -> int:
+        """Encoded body size times the number of publishes each message costs"""
+        body, _ = manager._encode_message(make_payload(0))
+        targets = manager._with_channel(lambda pooled: manager._publish_targets(pooled.channel, queue_id))
+        return len(body) * len(targets)
+
+    def single_publish(self) -> Dict:
+        count = self.args.messages
+        manager = self.manager()
+        queue_id = self.queue_name('single')
+        manager.declare_topology([QueueConfig(queue_id=queue_id)])
+        latencies = []
+        start = time.perf_counter()
+        for index in range(count):
+            began = time.perf_counter()
+            manager.publish_message(queue_id, make_payload(index))
+            latencies.append(time.perf_counter() - began)
+        elapsed = time.perf_counter() - start
+        result = summarize('single_publish', {}, count, elapsed, latencies,
+                           self.bytes_per_message(manager, queue_id))
+        self.cleanup(manager, [queue_id])
+        return result
+
+    def batch_publish(self, batch_size: int) -> Dict:
+        count = self.args.messages
+        manager = self.manager()
+        queue_id = self.queue_name('batch')
+        manager.declare_topology([QueueConfig(queue_id=queue_id)])
+        latencies = []
+        start = time.perf_counter()
+        for offset in range(0, count, batch_size):
+            batch = [make_payload(index) for index in range(offset, min(offset + batch_size, count))]
+            began = time.perf_counter()
+            manager.publish_batch(queue_id, batch)
+            # Every message in the batch waited for the whole batch to be confirmed
+            latencies.extend([time.perf_counter() - began] * len(batch))
+        elapsed = time.perf_counter() - start
+        result = summarize('batch_publish', {'batch_size': batch_size}, count, elapsed, latencies,
+                           self.bytes_per_message(manager, queue_id))
+        self.cleanup(manager, [queue_id])
+        return result
+
+    def fanout(self, sessions: int) -> Dict:
+        count = self.args.messages
+        manager = self.manager()
+        queue_id = self.queue_name('fanout')
+        manager.create_queue(QueueConfig(queue_id=queue_id))
+        for session in range(sessions):
+            manager.subscribe_to_queue(queue_id, 'bench', str(session))
+        latencies = []
+        start = time.perf_counter()
+        for index in range(count):
+            began = time.perf_counter()
+            manager.publish_message(queue_id, make_payload(index))
+            latencies.append(time.perf_counter() - began)
+        elapsed = time.perf_counter() - start
+        result = summarize('fanout', {'sessions': sessions}, count, elapsed, latencies,
+                           self.bytes_per_message(manager, queue_id))
+        self.cleanup(manager, [queue_id] + [f"{queue_id}_sub_bench_{s}" for s in range(sessions)])
+        return result
+
+    def replay(self, backlog: int, replay_mode: str) -> Dict:
+        manager = self.manager(replay_mode=replay_mode)
+        queue_id = self.queue_name('replay')
+        manager.declare_topology([QueueConfig(queue_id=queue_id)])
+        manager.publish_batch(queue_id, [make_payload(index) for index in range(backlog)])
+        began = time.perf_counter()
+        manager.subscribe_to_queue(queue_id, 'bench', 'replay')
+        elapsed = time.perf_counter() - began
+        result = summarize('replay', {'backlog': backlog, 'replay_mode': replay_mode}, backlog,
+                           elapsed, [elapsed], self.bytes_per_message(manager, queue_id))
+        self.cleanup(manager, [queue_id, f"{queue_id}_sub_bench_replay", f"{queue_id}_stream"])
+        return result
+
+    def consume(self, prefetch_count: int) -> Dict:
+        count = self.args.messages
+        manager = self.manager()
+        queue_id = self.queue_name('consume')
+        manager.create_queue(QueueConfig(queue_id=queue_id))
+        manager.subscribe_to_queue(queue_id, 'bench', 'consume')
+
+        latencies = []
+        done = threading.Event()
+        stop_event = threading.Event()
+
+        def callback(message):
+            latencies.append(time.perf_counter() - message['content']['sent_at'])
+            if len(latencies) >= count:
+                done.set()
+
+        consumer = threading.Thread(target=manager.consume_messages, args=(queue_id, callback, 'bench', 'consume'),
+                                    kwargs={'stop_event': stop_event, 'prefetch_count': prefetch_count})
+        start = time.perf_counter()
+        consumer.start()
+        for offset in range(0, count, 500):
+            manager.publish_batch(queue_id, [make_payload(index) for index in range(offset, min(offset + 500, count))])
+        done.wait(timeout=self.args.timeout)
+        elapsed = time.perf_counter() - start
+        stop_event.set()
+        consumer.join()
+        result = summarize('consume', {'prefetch_count': prefetch_count}, len(latencies), elapsed, latencies,
+                           self.bytes_per_message(manager, queue_id))
+        self.cleanup(manager, [queue_id, f"{queue_id}_sub_bench_consume"])
+        return result
+
+    def drain(self, manager: RabbitMQManager, queue_id: str, session_id: str, expected: int) -> List[int]:
+        """Consume a session until `expected` new messages arrived; returns the indexes received"""
+        received = []
+        done = threading.Event()
+        stop_event = threading.Event()
+
+        def callback(message):
+            received.append(message['content']['index'])
+            if len(received) >= expected:
+                done.set()
+
+        consumer = threading.Thread(target=manager.consume_messages, args=(queue_id, callback, 'bench', session_id),
+                                    kwargs={'stop_event': stop_event})
+        consumer.start()
+        done.wait(timeout=self.args.timeout)
+        stop_event.set()
+        consumer.join()
+        return received
+
+    def resume(self, backlog: int) -> Dict:
+        """
+        Restart a checkpointed MessageConsumer and time its resubscription. Also
+        checks that the resumed session gets no message it already processed.
+        """
+        manager = self.manager()
+        queue_id = self.queue_name('resume')
+        manager.create_queue(QueueConfig(queue_id=queue_id))
+        with tempfile.TemporaryDirectory() as directory:
+            checkpoints = SessionCheckpointStore(os.path.join(directory, 'sessions.json'))
+            session_id = MessageConsumer(manager, queue_id, 'bench', checkpoints=checkpoints).session_id
+            manager.publish_batch(queue_id, [dict(make_payload(index), index=index) for index in range(backlog)])
+            processed = set(self.drain(manager, queue_id, session_id, backlog))
+
+            began = time.perf_counter()
+            MessageConsumer(manager, queue_id, 'bench', checkpoints=checkpoints)
+            elapsed = time.perf_counter() - began
+            manager.publish_batch(queue_id, [dict(make_payload(index), index=index)
+                                             for index in range(backlog, 2 * backlog)])
+            received = self.drain(manager, queue_id, session_id, backlog)
+        duplicates = sum(1 for index in received if index in processed)
+        result = summarize('resume', {'backlog': backlog}, backlog, elapsed, [elapsed],
+                           self.bytes_per_message(manager, queue_id))
+        result['msgs_per_sec'] = None  # One resubscription: only its latency means anything
+        result['duplicates'] = duplicates
+        self.cleanup(manager, [queue_id, f"{queue_id}_sub_bench_{session_id}"])
+        if duplicates:
+            raise RuntimeError(f"Resumed session received {duplicates} already processed messages")
+        return result
+
+    def cleanup(self, manager: RabbitMQManager, queues: List[str]) -> None:
+        for queue_id in queues:
+            manager.delete_queue(queue_id)
+        manager.close()
+
+    def run(self) -> List[Dict]:
+        results = [self.single_publish()]
+        results += [self.batch_publish(size) for size in self.args.batch_sizes]
+        results += [self.fanout(sessions) for sessions in self.args.fanout_sessions]
+        for mode in (REPLAY_QUEUE, REPLAY_STREAM):
+            if mode == REPLAY_STREAM and self.broker is None and not self.args.streams:
+                continue
+            results += [self.replay(backlog, mode) for backlog in self.args.backlogs]
+        results += [self.consume(prefetch) for prefetch in self.args.prefetch]
+        results += [self.resume(backlog) for backlog in self.args.backlogs]
+        return results
+
+
+class RedisBenchmarks:
+    """Scenarios for RedisManager's publish_message / consume_messages path"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+
+    def manager(self):
+        sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'redis'))
+        from redis_manager import RedisManager
+        return RedisManager(host=self.args.redis_host, port=self.args.redis_port,
+                            password=self.args.redis_password)
+
+    async def publish(self, redis_manager, channel: str, backend: str) -> Dict:
+        count = self.args.messages
+        latencies = []
+        start = time.perf_counter()
+        for index in range(count):
+            began = time.perf_counter()
+            await redis_manager.publish_message(channel, make_payload(index))
+            latencies.append(time.perf_counter() - began)
+        elapsed = time.perf_counter() - start
+        size = len(json.dumps({'sequence': count, 'timestamp': datetime.now(UTC).isoformat(),
+                               'data': make_payload(0)}))
+        return summarize('redis_publish', {'backend': backend}, count, elapsed, latencies, size)
+
+    async def publish_batch(self, redis_manager, channel: str, batch_size: int, backend: str) -> Dict:
+        count = self.args.messages
+        latencies = []
+        start = time.perf_counter()
+        for offset in range(0, count, batch_size):
+            batch = [make_payload(index) for index in range(offset, min(offset + batch_size, count))]
+            began = time.perf_counter()
+            await redis_manager.publish_batch(channel, batch)
+            latencies.extend([time.perf_counter() - began] * len(batch))
+        elapsed = time.perf_counter() - start
+        size = len(json.dumps({'sequence': count, 'timestamp': datetime.now(UTC).isoformat(),
+                               'data': make_payload(0)}))
+        return summarize('redis_publish_batch', {'batch_size': batch_size, 'backend': backend}, count,
+                         elapsed, latencies, size)
+
+    async def replay(self, redis_manager, channel: str, backend: str) -> Dict:
+        """Time how long consume_messages takes to stream back the stored history"""
+        count = self.args.messages
+        latencies = []
+        received = 0
+        total_bytes = 0
+        start = time.perf_counter()
+        stream = redis_manager.consume_messages(channel, 0)
+        try:
+            previous = start
+            async for frame in stream:
+                now = time.perf_counter()
+                latencies.append(now - previous)
+                previous = now
+                received += frame.count('\n\n') or 1
+                total_bytes += len(frame)
+                if received >= count:
+                    break
+        finally:
+            await stream.aclose()
+        elapsed = time.perf_counter() - start
+        return summarize('redis_replay', {'backlog': count, 'backend': backend}, received, elapsed, latencies,
+                         total_bytes // received if received else None)
+
+    async def live(self, redis_manager, channel: str, backend: str) -> Dict:
+        """End-to-end latency from publish_message to the SSE frame reaching a live consumer"""
+        count = self.args.messages
+        latencies = []
+        total_bytes = 0
+        subscribed = asyncio.Event()
+        done = asyncio.Event()
+
+        async def consume() -> None:
+            nonlocal total_bytes
+            async for frame in redis_manager.consume_messages(channel):
+                now = time.perf_counter()
+                for event in frame.split('\n\n'):
+                    data = next((line[6:] for line in event.split('\n') if line.startswith('data: ')), None)
+                    if data is None:
+                        continue
+                    payload = json.loads(data)['data']
+                    if 'warmup' in payload:
+                        subscribed.set()
+                        continue
+                    latencies.append(now - payload['sent_at'])
+                    total_bytes += len(data)
+                if len(latencies) >= count:
+                    done.set()
+                    return
+
+        consumer = asyncio.create_task(consume())
+        try:
+            # Publish until the consumer sees one, so the measured messages all arrive live
+            while not subscribed.is_set():
+                await redis_manager.publish_message(channel, {'warmup': True})
+                try:
+                    await asyncio.wait_for(subscribed.wait(), 0.1)
+                except asyncio.TimeoutError:
+                    pass
+            start = time.perf_counter()
+            for index in range(count):
+                await redis_manager.publish_message(channel, make_payload(index))
+            await asyncio.wait_for(done.wait(), self.args.timeout)
+            elapsed = time.perf_counter() - start
+        finally:
+            consumer.cancel()
+            try:
+                await consumer
+            except asyncio.CancelledError:
+                pass
+        return summarize('redis_live', {'backend': backend}, len(latencies), elapsed, latencies,
+                         total_bytes // len(latencies) if latencies else None)
+
+    async def run_async(self) -> List[Dict]:
+        redis_manager = self.manager()
+        await redis_manager.connect()
+        channels = []
+        results = []
+        try:
+            # Same scenarios on the sorted-set and the Redis Streams backend
+            for backend in ('zset', 'stream'):
+                channel = f"bench_{os.getpid()}_{backend}"
+                batch_channels = [f"{channel}_batch_{size}" for size in self.args.batch_sizes]
+                live_channel = f"{channel}_live"
+                for name in [channel, live_channel] + batch_channels:
+                    redis_manager.set_channel_backend(name, backend)
+                    channels.append(name)
+                results.append(await self.publish(redis_manager, channel, backend))
+                for size, batch_channel in zip(self.args.batch_sizes, batch_channels):
+                    results.append(await self.publish_batch(redis_manager, batch_channel, size, backend))
+                results.append(await asyncio.wait_for(self.replay(redis_manager, channel, backend),
+                                                      self.args.timeout))
+                results.append(await self.live(redis_manager, live_channel, backend))
+            return results
+        finally:
+            for name in channels:
+                await redis_manager.clear_channel(name)
+            await redis_manager.close()
+
+    def run(self) -> List[Dict]:
+        try:
+            return asyncio.run(self.run_async())
+        except Exception as e:
+            return [{'scenario': 'redis', 'skipped': f"{type(e).__name__}: {e}"}]
+
+
+def git_version() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except Exception:
+        return None
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--broker', choices=['fake', 'rabbitmq'], default='fake')
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help='simulated round-trip seconds for the fake broker')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=5672)
+    parser.add_argument('--username', default='guest')
+    parser.add_argument('--password', default='guest')
+    parser.add_argument('--pool-size', type=int, default=4)
+    parser.add_argument('--streams', action='store_true',
+                        help='also run stream replay against a real broker (needs RabbitMQ 3.9+)')
+    parser.add_argument('--bind-main-queue', action='store_true',
+                        help='publish once to the fanout exchange, with the main queue bound to it')
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--fanout-sessions', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--backlogs', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--prefetch', type=int, nargs='+', default=[1, 10, 100])
+    parser.add_argument('--timeout', type=float, default=60.0)
+    parser.add_argument('--skip-redis', action='store_true')
+    parser.add_argument('--redis-host', default='localhost')
+    parser.add_argument('--redis-port', type=int, default=6379)
+    parser.add_argument('--redis-password', default=None)
+    parser.add_argument('--output', help='write the JSON report here instead of stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> Dict:
+    args = parse_args(argv)
+    report = {
+        'version': git_version(),
+        'started_at': datetime.now(UTC).isoformat(),
+        'python': sys.version.split()[0],
+        'broker': args.broker if args.broker == 'rabbitmq' else f"fake(latency={args.latency})",
+        'results': RabbitMQBenchmarks(args).run(),
+    }
+    if not args.skip_redis:
+        report['results'] += RedisBenchmarks(args).run()
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+    return report
+
+
+if __name__ == '__main__':
+    main()
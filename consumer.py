@@ -1,27 +1,54 @@
 import json
+from typing import Optional
 from uuid import uuid4
 from rabbit_mq_manager import QueueConfig, RabbitMQManager
+from session_checkpoint import SessionCheckpointStore
 
 
 class MessageConsumer:
-    def __init__(self, rabbitmq_manager: RabbitMQManager, queue_id: str, user_id: str, session_id: str = None):
+    def __init__(self, rabbitmq_manager: RabbitMQManager, queue_id: str, user_id: str, session_id: str = None,
+                 checkpoints: Optional[SessionCheckpointStore] = None):
         self.rabbitmq_manager = rabbitmq_manager
         self.queue_id = queue_id
         self.user_id = user_id
-        self.session_id =  str(uuid4())  # Generate a unique session ID if not provided
+        self.checkpoints = checkpoints
+        self.last_offset = None
 
-        # Subscribe this session to the queue
-        self.rabbitmq_manager.subscribe_to_queue(self.queue_id, self.user_id, self.session_id)
+        # Resume the saved session if there is one, otherwise start a new session
+        saved = checkpoints.load(queue_id, user_id) if checkpoints else None
+        self.session_id = session_id or (saved and saved['session_id']) or str(uuid4())
+        resumed = bool(saved and saved['session_id'] == self.session_id)
+        if resumed:
+            self.last_offset = saved.get('offset')
+
+        # Subscribe this session to the queue. A resumed session already received the
+        # backlog and kept receiving live messages in its own queue, so it skips the replay
+        # (the manager still replays if that queue has expired in the meantime)
+        self.rabbitmq_manager.subscribe_to_queue(self.queue_id, self.user_id, self.session_id, live_only=resumed)
+        if self.checkpoints:
+            self.checkpoints.save(self.queue_id, self.user_id, self.session_id, self.last_offset)
 
     def consume_messages(self):
         """Consume messages from the session-specific queue."""
         def callback(message):
             """Process the message."""
             print(f"Consumer {self.user_id} [Session {self.session_id}] received: {json.dumps(message)}")
+            # Checkpoint after processing, so a restart resumes right after this message
+            if self.checkpoints and message.get('offset') is not None:
+                self.last_offset = message['offset']
+                self.checkpoints.save(self.queue_id, self.user_id, self.session_id, self.last_offset)
+
+        # In stream replay mode, pick up right after the last processed offset
+        stream_offset = self.last_offset + 1 if self.last_offset is not None else 'first'
 
         # Start consuming messages
         print(f"Consumer {self.user_id} [Session {self.session_id}] started consuming from queue {self.queue_id}")
-        self.rabbitmq_manager.consume_messages(self.queue_id, callback, user_id=self.user_id, session_id=self.session_id)
+        try:
+            self.rabbitmq_manager.consume_messages(self.queue_id, callback, user_id=self.user_id,
+                                                   session_id=self.session_id, stream_offset=stream_offset)
+        finally:
+            if self.checkpoints:
+                self.checkpoints.close()
 
 if __name__ == "__main__":
     # RabbitMQ configuration
@@ -33,8 +60,11 @@ if __name__ == "__main__":
     rabbitmq_manager.create_queue(queue_config)
 
     # Create and run the consumer
-    # Provide a unique session_id if you want to distinguish between different instances explicitly
-    consumer = MessageConsumer(rabbitmq_manager, queue_id, user_id="user_1")
+    # The session is checkpointed locally, so a restart resumes the same session queue
+    # instead of leaking a new one; provide a session_id to pick a session explicitly
+    # Checkpoints are written at most once a second (and on exit) rather than per message
+    consumer = MessageConsumer(rabbitmq_manager, queue_id, user_id="user_1",
+                               checkpoints=SessionCheckpointStore(flush_interval=1.0))
 
     # Consume messages
     consumer.consume_messages()
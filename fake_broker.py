@@ -0,0 +1,503 @@
+import copy
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Any, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import pika
+from pika import frame, spec
+
+
+class _Queue:
+    """A classic queue (FIFO of messages) or a stream (append-only log)"""
+
+    def __init__(self, name: str, durable: bool, auto_delete: bool, arguments: Dict):
+        self.name = name
+        self.durable = durable
+        self.auto_delete = auto_delete
+        self.arguments = arguments
+        self.is_stream = arguments.get('x-queue-type') == 'stream'
+        # Classic: (body, properties, exchange, routing_key, redelivered)
+        self.messages: Deque[tuple] = deque()
+        # Stream: (published_at, body, properties, exchange, routing_key)
+        self.log: List[tuple] = []
+        self.consumers: List["_Consumer"] = []
+
+
+class _Consumer:
+    def __init__(self, channel: "FakeChannel", queue: _Queue, callback: Callable,
+                 tag: str, auto_ack: bool, arguments: Dict):
+        self.channel = channel
+        self.queue = queue
+        self.callback = callback
+        self.tag = tag
+        self.auto_ack = auto_ack
+        self.unacked = 0
+        self.cursor = self._start_offset(arguments.get('x-stream-offset', 'next')) if queue.is_stream else 0
+
+    def _start_offset(self, offset: Any) -> int:
+        log = self.queue.log
+        if offset == 'first':
+            return 0
+        if offset == 'last':
+            return max(len(log) - 1, 0)
+        if offset == 'next':
+            return len(log)
+        if isinstance(offset, datetime):
+            return next((i for i, entry in enumerate(log) if entry[0] >= offset), len(log))
+        return max(int(offset), 0)
+
+
+class FakeBroker:
+    """
+    In-process stand-in for a RabbitMQ broker, for offline tests and benchmarks.
+
+    It implements the subset of the pika BlockingConnection / BlockingChannel
+    API that RabbitMQManager uses: queue and exchange declaration (including
+    stream queues), fanout and default-exchange routing, basic_publish with
+    publisher confirms, basic_get, basic_consume with prefetch, acks, nacks
+    and queue_delete. Queue arguments such as x-expires are accepted but not
+    enforced.
+
+    Pass `broker.connect` wherever a connection factory is expected, e.g.
+    `RabbitMQManager(connection_factory=broker.connect)`. With `latency` set,
+    every synchronous round trip (connection and channel open, declares, gets,
+    qos, consume, delete) sleeps that many seconds, and publisher confirms
+    arrive that long after the publish.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.queues: Dict[str, _Queue] = {}
+        self.exchanges: Dict[str, Dict[str, Any]] = {}
+        self.round_trips = 0
+        self.published = 0
+        self.lock = threading.RLock()
+        self.changed = threading.Condition(self.lock)
+
+    def connect(self) -> "FakeConnection":
+        self.round_trip()
+        return FakeConnection(self)
+
+    def round_trip(self) -> None:
+        """Account for (and optionally simulate) one synchronous broker round trip"""
+        self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def notify(self) -> None:
+        with self.changed:
+            self.changed.notify_all()
+
+    def route(self, exchange: str, routing_key: str) -> List[_Queue]:
+        if exchange == '':
+            queue = self.queues.get(routing_key)
+            return [queue] if queue else []
+        bindings = self.exchanges.get(exchange, {}).get('bindings', ())
+        return [self.queues[name] for name in bindings if name in self.queues]
+
+    def message_count(self, queue: str) -> int:
+        with self.lock:
+            q = self.queues[queue]
+            return len(q.log) if q.is_stream else len(q.messages)
+
+
+class FakeConnection:
+    """Stand-in for pika.BlockingConnection bound to a FakeBroker"""
+
+    def __init__(self, broker: FakeBroker):
+        self.broker = broker
+        self.is_open = True
+        self.channels: List["FakeChannel"] = []
+        self._channel_numbers = itertools.count(1)
+        self._threadsafe_callbacks: Deque[Callable] = deque()
+        self._timers: List[Tuple[float, int, Callable]] = []
+        self._timer_ids = itertools.count(1)
+        self._cancelled_timers: Set[int] = set()
+
+    @property
+    def is_closed(self) -> bool:
+        return not self.is_open
+
+    def channel(self) -> "FakeChannel":
+        self._check_open()
+        self.broker.round_trip()
+        channel = FakeChannel(self, next(self._channel_numbers))
+        self.channels.append(channel)
+        return channel
+
+    def close(self) -> None:
+        if not self.is_open:
+            raise pika.exceptions.ConnectionWrongStateError('Connection is already closed')
+        for channel in list(self.channels):
+            if channel.is_open:
+                channel.close()
+        self.is_open = False
+        self.broker.notify()
+
+    def _check_open(self) -> None:
+        if not self.is_open:
+            raise pika.exceptions.ConnectionWrongStateError('Connection is closed')
+
+    def add_callback_threadsafe(self, callback: Callable) -> None:
+        self._check_open()
+        with self.broker.lock:
+            self._threadsafe_callbacks.append(callback)
+        self.broker.notify()
+
+    def call_later(self, delay: float, callback: Callable) -> int:
+        timer_id = next(self._timer_ids)
+        heapq.heappush(self._timers, (time.monotonic() + delay, timer_id, callback))
+        return timer_id
+
+    def remove_timeout(self, timer_id: int) -> None:
+        self._cancelled_timers.add(timer_id)
+
+    def sleep(self, duration: float) -> None:
+        self.process_data_events(time_limit=duration)
+
+    def process_data_events(self, time_limit: Optional[float] = 0) -> None:
+        """
+        Run ready callbacks, timers, confirms and deliveries for this connection.
+        Returns as soon as something was dispatched, or when time_limit expires
+        (time_limit=None waits for work indefinitely).
+        """
+        self._check_open()
+        deadline = None if time_limit is None else time.monotonic() + time_limit
+        while True:
+            if self._dispatch_once() or time_limit == 0:
+                return
+            with self.broker.changed:
+                timeout = self._next_due()
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return
+                    timeout = remaining if timeout is None else min(timeout, remaining)
+                if not self._has_work():
+                    self.broker.changed.wait(timeout)
+
+    def _next_due(self) -> Optional[float]:
+        due = [self._timers[0][0]] if self._timers else []
+        due += [channel._confirms[0][0] for channel in self.channels if channel._confirms]
+        return max(min(due) - time.monotonic(), 0) if due else None
+
+    def _has_work(self) -> bool:
+        if self._threadsafe_callbacks or not self.is_open:
+            return True
+        return any(channel._deliverable() for channel in self.channels)
+
+    def _dispatch_once(self) -> bool:
+        did_work = False
+        with self.broker.lock:
+            callbacks, self._threadsafe_callbacks = self._threadsafe_callbacks, deque()
+        for callback in callbacks:
+            callback()
+            did_work = True
+
+        now = time.monotonic()
+        while self._timers and self._timers[0][0] <= now:
+            _, timer_id, callback = heapq.heappop(self._timers)
+            if timer_id in self._cancelled_timers:
+                self._cancelled_timers.discard(timer_id)
+                continue
+            callback()
+            did_work = True
+
+        for channel in list(self.channels):
+            if channel.is_open and channel._dispatch(now):
+                did_work = True
+        return did_work
+
+
+class FakeChannel:
+    """Stand-in for pika's BlockingChannel (and, for confirms, its `_impl`)"""
+
+    def __init__(self, connection: FakeConnection, channel_number: int):
+        self.connection = connection
+        self.broker = connection.broker
+        self.channel_number = channel_number
+        self.is_open = True
+        self.prefetch_count = 0
+        self._consumers: "OrderedDict[str, _Consumer]" = OrderedDict()
+        self._consumer_tags = itertools.count(1)
+        self._next_tag = 1
+        # delivery tag -> (consumer or None, queue, message); message is None for streams
+        self._unacked: "OrderedDict[int, Tuple[Optional[_Consumer], _Queue, Optional[tuple]]]" = OrderedDict()
+        self._confirm_callback: Optional[Callable] = None
+        self._publish_seq = 0
+        self._confirms: Deque[Tuple[float, frame.Method]] = deque()
+        self._consuming = False
+
+    @property
+    def _impl(self) -> "FakeChannel":
+        return self
+
+    @property
+    def is_closed(self) -> bool:
+        return not self.is_open
+
+    def _check_open(self) -> None:
+        if not self.is_open or not self.connection.is_open:
+            raise pika.exceptions.ChannelWrongStateError('Channel is closed')
+
+    def _close_by_broker(self, reply_code: int, reply_text: str) -> None:
+        self._release()
+        raise pika.exceptions.ChannelClosedByBroker(reply_code, reply_text)
+
+    def _release(self) -> None:
+        """Cancel consumers and requeue unacked classic messages, as the broker does on close"""
+        with self.broker.lock:
+            for consumer in self._consumers.values():
+                if consumer in consumer.queue.consumers:
+                    consumer.queue.consumers.remove(consumer)
+            self._consumers.clear()
+            for _, queue, message in reversed(list(self._unacked.values())):
+                if message is not None:
+                    body, properties, exchange, routing_key, _ = message
+                    queue.messages.appendleft((body, properties, exchange, routing_key, True))
+            self._unacked.clear()
+            self.is_open = False
+        self.broker.notify()
+
+    def close(self) -> None:
+        self._release()
+
+    # Declarations
+
+    def queue_declare(self, queue: str, passive: bool = False, durable: bool = False,
+                      exclusive: bool = False, auto_delete: bool = False,
+                      arguments: Optional[Dict] = None):
+        self._check_open()
+        self.broker.round_trip()
+        with self.broker.lock:
+            existing = self.broker.queues.get(queue)
+            if existing is None:
+                if passive:
+                    self._close_by_broker(404, f"NOT_FOUND - no queue '{queue}'")
+                existing = self.broker.queues[queue] = _Queue(queue, durable, auto_delete, dict(arguments or {}))
+            elif not passive and existing.arguments != dict(arguments or {}):
+                self._close_by_broker(406, f"PRECONDITION_FAILED - inequivalent arg for queue '{queue}'")
+            count = len(existing.log) if existing.is_stream else len(existing.messages)
+            return SimpleNamespace(method=spec.Queue.DeclareOk(queue, count, len(existing.consumers)))
+
+    def exchange_declare(self, exchange: str, exchange_type: str = 'direct', passive: bool = False,
+                         durable: bool = False, auto_delete: bool = False, internal: bool = False,
+                         arguments: Optional[Dict] = None):
+        self._check_open()
+        self.broker.round_trip()
+        with self.broker.lock:
+            if exchange not in self.broker.exchanges:
+                if passive:
+                    self._close_by_broker(404, f"NOT_FOUND - no exchange '{exchange}'")
+                self.broker.exchanges[exchange] = {'type': str(exchange_type), 'bindings': set()}
+        return SimpleNamespace(method=spec.Exchange.DeclareOk())
+
+    def queue_bind(self, queue: str, exchange: str, routing_key: Optional[str] = None,
+                   arguments: Optional[Dict] = None):
+        self._check_open()
+        self.broker.round_trip()
+        with self.broker.lock:
+            if exchange not in self.broker.exchanges:
+                self._close_by_broker(404, f"NOT_FOUND - no exchange '{exchange}'")
+            if queue not in self.broker.queues:
+                self._close_by_broker(404, f"NOT_FOUND - no queue '{queue}'")
+            self.broker.exchanges[exchange]['bindings'].add(queue)
+        return SimpleNamespace(method=spec.Queue.BindOk())
+
+    def queue_delete(self, queue: str, if_unused: bool = False, if_empty: bool = False):
+        self._check_open()
+        self.broker.round_trip()
+        with self.broker.lock:
+            deleted = self.broker.queues.pop(queue, None)
+            for exchange in self.broker.exchanges.values():
+                exchange['bindings'].discard(queue)
+            count = 0
+            if deleted is not None:
+                count = len(deleted.log) if deleted.is_stream else len(deleted.messages)
+                for consumer in deleted.consumers:
+                    consumer.channel._consumers.pop(consumer.tag, None)
+        return SimpleNamespace(method=spec.Queue.DeleteOk(count))
+
+    # Publishing
+
+    def confirm_delivery(self, ack_nack_callback: Optional[Callable] = None,
+                         callback: Optional[Callable] = None) -> None:
+        self._check_open()
+        self.broker.round_trip()
+        self._confirm_callback = ack_nack_callback or (lambda method_frame: None)
+        if callback is not None:
+            callback(frame.Method(self.channel_number, spec.Confirm.SelectOk()))
+
+    def basic_publish(self, exchange: str, routing_key: str, body: bytes,
+                      properties: Optional[pika.BasicProperties] = None, mandatory: bool = False) -> None:
+        self._check_open()
+        properties = properties or pika.BasicProperties()
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        with self.broker.lock:
+            if exchange and exchange not in self.broker.exchanges:
+                self._close_by_broker(404, f"NOT_FOUND - no exchange '{exchange}'")
+            for queue in self.broker.route(exchange, routing_key):
+                if queue.is_stream:
+                    queue.log.append((datetime.utcnow(), body, properties, exchange, routing_key))
+                else:
+                    queue.messages.append((body, properties, exchange, routing_key, False))
+            self.broker.published += 1
+            if self._confirm_callback is not None:
+                self._publish_seq += 1
+                ack = frame.Method(self.channel_number, spec.Basic.Ack(delivery_tag=self._publish_seq))
+                self._confirms.append((time.monotonic() + self.broker.latency, ack))
+        self.broker.notify()
+
+    # Getting and consuming
+
+    def basic_qos(self, prefetch_size: int = 0, prefetch_count: int = 0, global_qos: bool = False) -> None:
+        self._check_open()
+        self.broker.round_trip()
+        self.prefetch_count = prefetch_count
+
+    def basic_get(self, queue: str, auto_ack: bool = False):
+        self._check_open()
+        self.broker.round_trip()
+        with self.broker.lock:
+            q = self.broker.queues.get(queue)
+            if q is None:
+                self._close_by_broker(404, f"NOT_FOUND - no queue '{queue}'")
+            if q.is_stream:
+                self._close_by_broker(406, "PRECONDITION_FAILED - basic.get not supported by stream queues")
+            if not q.messages:
+                return None, None, None
+            message = q.messages.popleft()
+            body, properties, exchange, routing_key, redelivered = message
+            tag = self._next_tag
+            self._next_tag += 1
+            if not auto_ack:
+                self._unacked[tag] = (None, q, message)
+            method = spec.Basic.GetOk(tag, redelivered, exchange, routing_key, len(q.messages))
+            return method, properties, body
+
+    def basic_consume(self, queue: str, on_message_callback: Callable, auto_ack: bool = False,
+                      exclusive: bool = False, consumer_tag: Optional[str] = None,
+                      arguments: Optional[Dict] = None) -> str:
+        self._check_open()
+        self.broker.round_trip()
+        with self.broker.lock:
+            q = self.broker.queues.get(queue)
+            if q is None:
+                self._close_by_broker(404, f"NOT_FOUND - no queue '{queue}'")
+            if q.is_stream and (auto_ack or not self.prefetch_count):
+                self._close_by_broker(406, "PRECONDITION_FAILED - stream consumers need manual ack and a prefetch")
+            tag = consumer_tag or f"ctag{self.channel_number}.{next(self._consumer_tags)}"
+            consumer = _Consumer(self, q, on_message_callback, tag, auto_ack, arguments or {})
+            self._consumers[tag] = consumer
+            q.consumers.append(consumer)
+        self.broker.notify()
+        return tag
+
+    def basic_cancel(self, consumer_tag: str) -> None:
+        with self.broker.lock:
+            consumer = self._consumers.pop(consumer_tag, None)
+            if consumer is not None and consumer in consumer.queue.consumers:
+                consumer.queue.consumers.remove(consumer)
+
+    def basic_ack(self, delivery_tag: int = 0, multiple: bool = False) -> None:
+        self._check_open()
+        with self.broker.lock:
+            for tag in self._settled_tags(delivery_tag, multiple):
+                consumer, _, _ = self._unacked.pop(tag)
+                if consumer is not None:
+                    consumer.unacked -= 1
+        self.broker.notify()
+
+    def basic_nack(self, delivery_tag: int = 0, multiple: bool = False, requeue: bool = True) -> None:
+        self._check_open()
+        with self.broker.lock:
+            requeued = []
+            for tag in self._settled_tags(delivery_tag, multiple):
+                consumer, queue, message = self._unacked.pop(tag)
+                if consumer is not None:
+                    consumer.unacked -= 1
+                if requeue and message is not None:
+                    body, properties, exchange, routing_key, _ = message
+                    requeued.append((queue, (body, properties, exchange, routing_key, True)))
+            for queue, message in reversed(requeued):
+                queue.messages.appendleft(message)
+        self.broker.notify()
+
+    def basic_reject(self, delivery_tag: int, requeue: bool = True) -> None:
+        self.basic_nack(delivery_tag, multiple=False, requeue=requeue)
+
+    def _settled_tags(self, delivery_tag: int, multiple: bool) -> List[int]:
+        if not multiple:
+            if delivery_tag not in self._unacked:
+                self._close_by_broker(406, f"PRECONDITION_FAILED - unknown delivery tag {delivery_tag}")
+            return [delivery_tag]
+        return [tag for tag in self._unacked if tag <= delivery_tag]
+
+    def start_consuming(self) -> None:
+        self._consuming = True
+        while self._consuming and self._consumers and self.is_open:
+            self.connection.process_data_events(time_limit=None)
+
+    def stop_consuming(self, consumer_tag: Optional[str] = None) -> None:
+        for tag in list(self._consumers):
+            if consumer_tag is None or tag == consumer_tag:
+                self.basic_cancel(tag)
+        self._consuming = False
+
+    def _deliverable(self) -> bool:
+        if self._confirms and self._confirms[0][0] <= time.monotonic():
+            return True
+        return any(self._next_message(consumer, peek=True) for consumer in self._consumers.values())
+
+    def _next_message(self, consumer: _Consumer, peek: bool = False) -> Optional[tuple]:
+        """Take (under the broker lock) the next message the consumer has credit for"""
+        if self.prefetch_count and consumer.unacked >= self.prefetch_count:
+            return None
+        queue = consumer.queue
+        if queue.is_stream:
+            if consumer.cursor >= len(queue.log):
+                return None
+            published_at, body, properties, exchange, routing_key = queue.log[consumer.cursor]
+            if peek:
+                return True
+            offset = consumer.cursor
+            consumer.cursor += 1
+            properties = copy.copy(properties)
+            properties.headers = {**(properties.headers or {}), 'x-stream-offset': offset}
+            return None, (body, properties, exchange, routing_key, False)
+        if not queue.messages:
+            return None
+        if peek:
+            return True
+        message = queue.messages.popleft()
+        return message, message
+
+    def _dispatch(self, now: float) -> bool:
+        did_work = False
+        while self._confirms and self._confirms[0][0] <= now:
+            _, ack = self._confirms.popleft()
+            self._confirm_callback(ack)
+            did_work = True
+
+        for consumer in list(self._consumers.values()):
+            while self.is_open and consumer.tag in self._consumers:
+                with self.broker.lock:
+                    taken = self._next_message(consumer)
+                    if taken is None:
+                        break
+                    stored, (body, properties, exchange, routing_key, redelivered) = taken
+                    tag = self._next_tag
+                    self._next_tag += 1
+                    if not consumer.auto_ack:
+                        self._unacked[tag] = (consumer, consumer.queue, stored)
+                        consumer.unacked += 1
+                method = spec.Basic.Deliver(consumer.tag, tag, redelivered, exchange, routing_key)
+                consumer.callback(self, method, properties, body)
+                did_work = True
+        return did_work
@@ -0,0 +1,131 @@
+import json
+import zlib
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+
+# Optional fast serializers / compressors, used when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+
+@dataclass(frozen=True)
+class Serializer:
+    """Turns message objects into bytes and back for one AMQP content type"""
+    name: str
+    content_type: str
+    dumps: Callable[[Any], bytes]
+    loads: Callable[[bytes], Any]
+
+
+@dataclass(frozen=True)
+class Compressor:
+    """Compresses message bodies for one AMQP content encoding"""
+    content_encoding: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+@dataclass(frozen=True)
+class EncodedMessage:
+    """An encoded body together with the properties needed to decode it"""
+    body: bytes
+    content_type: str
+    content_encoding: Optional[str] = None
+
+
+def _json_dumps(obj: Any) -> bytes:
+    return json.dumps(obj).encode('utf-8')
+
+
+def _build_serializers() -> Dict[str, Serializer]:
+    serializers = {
+        'json': Serializer('json', 'application/json', _json_dumps, json.loads),
+    }
+    if orjson is not None:
+        serializers['orjson'] = Serializer('orjson', 'application/json', orjson.dumps, orjson.loads)
+    if msgpack is not None:
+        serializers['msgpack'] = Serializer(
+            'msgpack', 'application/msgpack',
+            lambda obj: msgpack.packb(obj, use_bin_type=True),
+            lambda body: msgpack.unpackb(body, raw=False),
+        )
+    return serializers
+
+
+def _build_compressors() -> Dict[str, Compressor]:
+    compressors = {
+        'zlib': Compressor('deflate', zlib.compress, zlib.decompress),
+    }
+    if lz4_frame is not None:
+        compressors['lz4'] = Compressor('lz4', lz4_frame.compress, lz4_frame.decompress)
+    return compressors
+
+
+SERIALIZERS = _build_serializers()
+COMPRESSORS = _build_compressors()
+
+
+class MessageCodec:
+    """
+    Encodes messages once per publish and decodes them from their AMQP
+    `content_type` / `content_encoding` properties.
+
+    Decoding does not depend on how this codec is configured, so consumers
+    can read messages from producers using any supported serializer.
+    """
+
+    def __init__(self, serializer: str = 'json', compression: Optional[str] = None,
+                 compress_threshold: int = 1024):
+        """
+        Args:
+            serializer: 'json', 'orjson' or 'msgpack' (the latter two when installed)
+            compression: None, 'zlib' or 'lz4' (when installed)
+            compress_threshold: Only bodies of at least this many bytes are compressed
+        """
+        if serializer not in SERIALIZERS:
+            raise ValueError(f"Serializer {serializer!r} is not available; "
+                             f"choose from {sorted(SERIALIZERS)}")
+        if compression is not None and compression not in COMPRESSORS:
+            raise ValueError(f"Compression {compression!r} is not available; "
+                             f"choose from {sorted(COMPRESSORS)}")
+        self.serializer = SERIALIZERS[serializer]
+        self.compressor = COMPRESSORS[compression] if compression else None
+        self.compress_threshold = compress_threshold
+
+        # Decoders by content type; JSON is always read with the fastest parser available
+        self._loads = {s.content_type: s.loads for s in SERIALIZERS.values() if s.name != 'orjson'}
+        if orjson is not None:
+            self._loads['application/json'] = orjson.loads
+        self._decompressors = {c.content_encoding: c.decompress for c in COMPRESSORS.values()}
+
+    def encode(self, obj: Any) -> EncodedMessage:
+        body = self.serializer.dumps(obj)
+        if self.compressor is not None and len(body) >= self.compress_threshold:
+            return EncodedMessage(self.compressor.compress(body), self.serializer.content_type,
+                                  self.compressor.content_encoding)
+        return EncodedMessage(body, self.serializer.content_type)
+
+    def decode(self, body: bytes, content_type: Optional[str] = None,
+               content_encoding: Optional[str] = None) -> Any:
+        """Decode a body; messages without a content type are treated as JSON"""
+        if content_encoding and content_encoding != 'identity':
+            decompress = self._decompressors.get(content_encoding)
+            if decompress is None:
+                raise ValueError(f"Unsupported content encoding: {content_encoding}")
+            body = decompress(body)
+        loads = self._loads.get(content_type or 'application/json')
+        if loads is None:
+            raise ValueError(f"Unsupported content type: {content_type}")
+        return loads(body)
@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
 import time
 from threading import Thread
-from rabbit_mq_manager import RabbitMQManager
+from uuid import uuid4
+from rabbit_mq_manager import RabbitMQManager, TopicSubscription
 from datetime import datetime, UTC
 import json
-from typing import Dict, List
+from typing import Callable, Dict, List, Optional
 
 
 class DataConsumer:
-    def __init__(self, rabbitmq: RabbitMQManager, topics: List[str], user_id: str = None):
+    def __init__(self, rabbitmq: RabbitMQManager, topics: List[str], user_id: str = None,
+                 topic_callbacks: Optional[Dict[str, Callable]] = None,
+                 prefetch: Optional[Dict[str, int]] = None, session_id: str = None):
         """
         Initialize consumer with RabbitMQ manager and topics
         
@@ -16,10 +19,16 @@ class DataConsumer:
             rabbitmq: RabbitMQManager instance
             topics: List of topics to consume messages from
             user_id: Optional user ID for subscribed consumer
+            topic_callbacks: Optional per-topic callbacks (default: process_message)
+            prefetch: Optional per-topic prefetch counts (default: 1)
+            session_id: Session ID for the topic subscriptions (generated if not provided)
         """
         self.rabbitmq = rabbitmq
         self.topics = topics
         self.user_id = user_id
+        self.topic_callbacks = topic_callbacks or {}
+        self.prefetch = prefetch or {}
+        self.session_id = session_id or str(uuid4())
 
     def process_message(self, message: Dict):
         """Process received message"""
@@ -42,15 +51,20 @@ class DataConsumer:
         print(f"Starting consumer{' (Subscriber: ' + self.user_id + ')' if self.user_id else ''}")
         print(f"Listening to topics: {', '.join(self.topics)}")
         
+        # All topics are multiplexed over one connection and one I/O loop
+        subscriptions = []
         for topic in self.topics:
-            try:
-                self.rabbitmq.consume_messages(
-                    queue_id=topic,
-                    callback=self.process_message,
-                    user_id=self.user_id
-                )
-            except Exception as e:
-                print(f"Error consuming from {topic}: {str(e)}")
+            if not self.rabbitmq.subscribe_to_queue(topic, self.user_id, self.session_id):
+                print(f"Error subscribing to {topic}")
+                continue
+            subscriptions.append(TopicSubscription(
+                queue_id=topic,
+                callback=self.topic_callbacks.get(topic, self.process_message),
+                user_id=self.user_id,
+                session_id=self.session_id,
+                prefetch_count=self.prefetch.get(topic, 1)
+            ))
+        self.rabbitmq.consume_topics(subscriptions)
 
 
 def create_consumer(rabbitmq: RabbitMQManager, topics: List[str], user_id: str, delay: int = 0):
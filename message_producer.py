@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
 from rabbit_mq_manager import RabbitMQManager, QueueConfig
+from async_rabbit_mq_manager import AsyncRabbitMQManager
 import time
 import random
 import json
@@ -9,26 +10,21 @@ from typing import List, Dict
 
 
 class DataProducer:
-    def __init__(self, rabbitmq: RabbitMQManager, topics: List[str]):
+    def __init__(self, rabbitmq: AsyncRabbitMQManager, topics: List[str]):
         """
         Initialize producer with RabbitMQ manager and topics
         
         Args:
-            rabbitmq: RabbitMQManager instance
+            rabbitmq: AsyncRabbitMQManager instance, so publishing never blocks the event loop
             topics: List of topics to produce messages for
         """
         self.rabbitmq = rabbitmq
         self.topics = topics
-        self._setup_queues()
         
-    def _setup_queues(self):
-        """Set up queues for all topics"""
-        for topic in self.topics:
-            config = QueueConfig(
-                queue_id=topic,
-                durable=True
-            )
-            self.rabbitmq.create_queue(config)
+    async def _setup_queues(self):
+        """Set up queues and fanout exchanges for all topics in one pass"""
+        configs = [QueueConfig(queue_id=topic, durable=True) for topic in self.topics]
+        await self.rabbitmq.declare_topology(configs)
             
     def generate_message(self, topic: str) -> Dict:
         """Generate a sample message for given topic"""
@@ -60,23 +56,34 @@ class DataProducer:
         })
         return base_message
 
-    async def produce_messages(self, interval: float = 5.0):
+    async def produce_messages(self, interval: float = 5.0, batch_size: int = 1):
         """
         Continuously produce messages for all topics
         
         Args:
             interval: Time interval between messages in seconds
+            batch_size: Messages generated per topic per interval; above 1 they
+                are sent with a single confirmed `publish_batch` call
         """
+        await self._setup_queues()
         while True:
-            for topic in self.topics:
-                message = self.generate_message(topic)
-                success = self.rabbitmq.publish_message(topic, message)
-                if success:
-                    print(f"Published to {topic}: {json.dumps(message, indent=2)}")
-                else:
-                    print(f"Failed to publish to {topic}")
+            # Topics are published concurrently on the manager's I/O threads
+            await asyncio.gather(*(self._produce_topic(topic, batch_size) for topic in self.topics))
             await asyncio.sleep(interval)
 
+    async def _produce_topic(self, topic: str, batch_size: int):
+        if batch_size > 1:
+            messages = [self.generate_message(topic) for _ in range(batch_size)]
+            result = await self.rabbitmq.publish_batch(topic, messages)
+            print(f"Published batch to {topic}: {len(result.acked)} acked, {len(result.nacked)} nacked")
+            return
+        message = self.generate_message(topic)
+        success = await self.rabbitmq.publish_message(topic, message)
+        if success:
+            print(f"Published to {topic}: {json.dumps(message, indent=2)}")
+        else:
+            print(f"Failed to publish to {topic}")
+
 
 if __name__ == "__main__":
     # Initialize RabbitMQ manager with Docker credentials
@@ -91,5 +98,5 @@ if __name__ == "__main__":
     topics = ['orders', 'users', 'metrics']
     
     # Run producer
-    producer = DataProducer(rabbitmq, topics)
+    producer = DataProducer(AsyncRabbitMQManager(rabbitmq), topics)
     asyncio.run(producer.produce_messages())
\ No newline at end of file
@@ -0,0 +1,211 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Latency buckets in seconds, Prometheus style (cumulative, +Inf implied)
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Buckets for histograms of counts, e.g. messages per frame
+COUNT_BUCKETS = (1, 2, 5, 10, 50, 100, 500, 1000)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+class MetricsSink:
+    """
+    Interface the managers report to. This base class discards everything,
+    so a manager without a configured sink pays only for a method call.
+    """
+    enabled = False
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        pass
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        pass
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        pass
+
+    def adjust_gauge(self, name: str, delta: float, **labels) -> None:
+        pass
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        yield
+
+    def set_buckets(self, name: str, buckets: Tuple[float, ...]) -> None:
+        """Use `buckets` for one histogram instead of the default latency buckets"""
+        pass
+
+
+class NullMetrics(MetricsSink):
+    """No-op sink with a shared, allocation-free timer"""
+
+    def timer(self, name: str, **labels):
+        return _NULL_TIMER
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Histogram:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, fraction: float) -> Optional[float]:
+        """Upper bound of the bucket containing the requested quantile"""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+
+class InMemoryMetrics(MetricsSink):
+    """Thread-safe sink that keeps counters, gauges and histograms in memory"""
+    enabled = True
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+                 metric_buckets: Optional[Dict[str, Tuple[float, ...]]] = None):
+        self.buckets = buckets
+        self.metric_buckets: Dict[str, Tuple[float, ...]] = dict(metric_buckets or {})
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self._histograms: Dict[str, Dict[LabelKey, _Histogram]] = {}
+
+    @staticmethod
+    def _key(labels: Dict[str, object]) -> LabelKey:
+        return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+    def increment(self, name: str, value: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self.metric_buckets.get(name, self.buckets))
+            histogram.observe(value)
+
+    def set_buckets(self, name: str, buckets: Tuple[float, ...]) -> None:
+        """Takes effect for series created afterwards"""
+        with self._lock:
+            self.metric_buckets[name] = tuple(sorted(buckets))
+
+    def set_gauge(self, name: str, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._gauges.setdefault(name, {})[key] = value
+
+    def adjust_gauge(self, name: str, delta: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            series = self._gauges.setdefault(name, {})
+            series[key] = series.get(key, 0) + delta
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Return a plain-dict copy of every metric, keyed by name and label string"""
+        def label_str(key: LabelKey) -> str:
+            return ','.join(f"{name}={value}" for name, value in key)
+
+        with self._lock:
+            return {
+                'counters': {name: {label_str(k): v for k, v in series.items()}
+                             for name, series in self._counters.items()},
+                'gauges': {name: {label_str(k): v for k, v in series.items()}
+                           for name, series in self._gauges.items()},
+                'histograms': {
+                    name: {label_str(k): {'count': h.count, 'sum': h.sum,
+                                          'p50': h.quantile(0.5), 'p99': h.quantile(0.99),
+                                          'p999': h.quantile(0.999)}
+                           for k, h in series.items()}
+                    for name, series in self._histograms.items()
+                },
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._gauges.clear()
+            self._histograms.clear()
+
+
+class PrometheusMetrics(InMemoryMetrics):
+    """In-memory sink that can render itself in the Prometheus text exposition format"""
+
+    @staticmethod
+    def _labels(key: LabelKey, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = key + extra
+        if not pairs:
+            return ''
+        escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+                   for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+    def render(self) -> str:
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(f"{name}{self._labels(key)} {value}" for key, value in series.items())
+            for name, series in sorted(self._gauges.items()):
+                lines.append(f"# TYPE {name} gauge")
+                lines.extend(f"{name}{self._labels(key)} {value}" for key, value in series.items())
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for key, histogram in series.items():
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{self._labels(key, (('le', repr(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{self._labels(key, (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{self._labels(key)} {histogram.sum}")
+                    lines.append(f"{name}_count{self._labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+
+def mount_metrics(app, metrics: PrometheusMetrics, path: str = '/metrics') -> None:
+    """Expose a PrometheusMetrics sink on a FastAPI app"""
+    from fastapi.responses import PlainTextResponse
+
+    @app.get(path, response_class=PlainTextResponse, include_in_schema=False)
+    async def prometheus_metrics():
+        return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
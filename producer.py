@@ -2,7 +2,7 @@ import time
 import json
 from datetime import datetime
 
-from rabbit_mq_manager import QueueConfig, RabbitMQManager
+from rabbit_mq_manager import BatchPublisher, QueueConfig, RabbitMQManager
 
 class MessageProducer:
     def __init__(self, rabbitmq_manager: RabbitMQManager, queue_id: str):
@@ -10,20 +10,31 @@ class MessageProducer:
         self.queue_id = queue_id
         self.message_index = 1
 
-    def produce_message(self):
-        """Produce a message every 10 seconds with an incrementing index"""
+    def produce_message(self, batch_size: int = 1):
+        """
+        Produce a message every 10 seconds with an incrementing index.
+        With batch_size above 1, that many messages are produced per tick and
+        sent through a BatchPublisher with publisher confirms.
+        """
+        publisher = BatchPublisher(self.rabbitmq_manager, self.queue_id, batch_size=batch_size)
         while True:
-            message = {
-                'index': self.message_index,
-                'content': f'Message #{self.message_index}',
-                'timestamp': datetime.utcnow().isoformat()
-            }
-            success = self.rabbitmq_manager.publish_message(self.queue_id, message)
-            if success:
-                print(f"Produced: {json.dumps(message)}")
-            else:
-                print("Failed to produce message")
-            self.message_index += 1
+            for _ in range(batch_size):
+                message = {
+                    'index': self.message_index,
+                    'content': f'Message #{self.message_index}',
+                    'timestamp': datetime.utcnow().isoformat()
+                }
+                if batch_size > 1:
+                    result = publisher.publish(message)
+                    if result is not None:
+                        print(f"Produced batch: {len(result.acked)} acked, {len(result.nacked)} nacked")
+                else:
+                    success = self.rabbitmq_manager.publish_message(self.queue_id, message)
+                    if success:
+                        print(f"Produced: {json.dumps(message)}")
+                    else:
+                        print("Failed to produce message")
+                self.message_index += 1
             time.sleep(5)  # Wait for 10 seconds before producing the next message
 
 
@@ -0,0 +1,242 @@
+import cProfile
+import logging
+import os
+import pstats
+import random
+import signal
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from functools import wraps
+from io import StringIO
+from typing import Callable, Dict, Iterator, List, Optional
+
+PROFILE_CPU = 'cprofile'
+PROFILE_MEMORY = 'tracemalloc'
+
+
+class _NullContext:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_CONTEXT = _NullContext()
+
+
+class SamplingProfiler:
+    """
+    Opt-in profiler for publish and consume hot paths.
+
+    A `sample_rate` fraction of operations is run under cProfile (CPU time) or
+    tracemalloc (allocated bytes), and the results are aggregated per key,
+    e.g. 'publish:orders' or 'consume:orders'. Only one operation is profiled
+    at a time: a sample that would overlap another is simply skipped. With the
+    default rate of 0 the profiler does nothing.
+
+    Aggregated stacks can be read with `collapsed()` (the collapsed-stack
+    format accepted by flamegraph.pl and speedscope), written out with `dump()`,
+    or dumped on a signal after `install_signal_handler()`.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, mode: str = PROFILE_CPU,
+                 dump_dir: str = 'profiles', traceback_limit: int = 32):
+        if mode not in (PROFILE_CPU, PROFILE_MEMORY):
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        self.sample_rate = sample_rate
+        self.mode = mode
+        self.dump_dir = dump_dir
+        self.traceback_limit = traceback_limit
+        self.logger = logging.getLogger(__name__)
+        self._sampling = threading.Lock()  # held while an operation is being profiled
+        self._lock = threading.Lock()  # guards the aggregates
+        self._cpu: Dict[str, pstats.Stats] = {}
+        self._memory: Dict[str, Counter] = {}
+        self._samples: Counter = Counter()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def profile(self, key: str):
+        """Context manager that profiles the block if this call is sampled"""
+        if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+            return _NULL_CONTEXT
+        if not self._sampling.acquire(blocking=False):
+            return _NULL_CONTEXT
+        return self._profiled(key)
+
+    def wrap(self, key: str, function: Callable) -> Callable:
+        """Return `function` wrapped so that sampled calls are profiled under `key`"""
+        if not self.enabled:
+            return function
+
+        @wraps(function)
+        def profiled(*args, **kwargs):
+            with self.profile(key):
+                return function(*args, **kwargs)
+
+        return profiled
+
+    @contextmanager
+    def _profiled(self, key: str) -> Iterator[None]:
+        try:
+            if self.mode == PROFILE_CPU:
+                with self._cpu_sample(key):
+                    yield
+            else:
+                with self._memory_sample(key):
+                    yield
+        finally:
+            self._sampling.release()
+
+    @contextmanager
+    def _cpu_sample(self, key: str) -> Iterator[None]:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            with self._lock:
+                self._samples[key] += 1
+                if key in self._cpu:
+                    self._cpu[key].add(profiler)
+                else:
+                    self._cpu[key] = pstats.Stats(profiler)
+
+    @contextmanager
+    def _memory_sample(self, key: str) -> Iterator[None]:
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start(self.traceback_limit)
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            after = tracemalloc.take_snapshot()
+            if started:
+                tracemalloc.stop()
+            # Ignore the profiler's own allocations
+            exclude = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+            diff = after.filter_traces(exclude).compare_to(before.filter_traces(exclude), 'traceback')
+            with self._lock:
+                self._samples[key] += 1
+                stacks = self._memory.setdefault(key, Counter())
+                for stat in diff:
+                    if stat.size_diff > 0:
+                        # Frames run from the oldest to the most recent call
+                        stack = ';'.join(f"{frame.filename}:{frame.lineno}" for frame in stat.traceback)
+                        stacks[stack] += stat.size_diff
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return sorted(self._samples)
+
+    def samples(self, key: str) -> int:
+        with self._lock:
+            return self._samples.get(key, 0)
+
+    def collapsed(self, key: str) -> str:
+        """
+        Collapsed stacks for one key, one 'frame;frame;frame weight' line per stack.
+        Weights are microseconds of CPU time, or bytes allocated in memory mode.
+        """
+        with self._lock:
+            if key in self._memory:
+                stacks = Counter(self._memory[key])
+            elif key in self._cpu:
+                stacks = _collapse_stats(self._cpu[key].stats)
+            else:
+                stacks = Counter()
+        return ''.join(f"{stack} {weight}\n" for stack, weight in sorted(stacks.items()) if weight > 0)
+
+    def report(self, key: str, limit: int = 20) -> str:
+        """pstats table of the most expensive functions for one key (CPU mode)"""
+        output = StringIO()
+        with self._lock:
+            stats = self._cpu.get(key)
+            if stats is None:
+                return ''
+            stats.stream = output
+            stats.sort_stats('cumulative').print_stats(limit)
+        return output.getvalue()
+
+    def dump(self, directory: Optional[str] = None) -> List[str]:
+        """Write one collapsed-stack file per key and return their paths"""
+        directory = directory or self.dump_dir
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for key in self.keys():
+            filename = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in key)
+            path = os.path.join(directory, f"{filename}.{self.mode}.collapsed")
+            with open(path, 'w') as f:
+                f.write(self.collapsed(key))
+            paths.append(path)
+        self.logger.info(f"Wrote {len(paths)} profiles to {directory}")
+        return paths
+
+    def install_signal_handler(self, signum: Optional[int] = None) -> None:
+        """
+        Dump profiles whenever the process receives `signum` (SIGUSR1 by default,
+        which does not exist on Windows). Must be called from the main thread.
+        """
+        if signum is None:
+            signum = signal.SIGUSR1
+
+        def handler(received, frame):
+            # Dump off the signal handler, which may have interrupted a holder of the lock
+            threading.Thread(target=self.dump, name='profile-dump', daemon=True).start()
+
+        signal.signal(signum, handler)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._cpu.clear()
+            self._memory.clear()
+            self._samples.clear()
+
+
+def _frame_name(function) -> str:
+    filename, lineno, name = function
+    if filename == '~':
+        return name  # built-in, e.g. "<method 'encode' of 'str' objects>"
+    return f"{name} ({os.path.basename(filename)}:{lineno})"
+
+
+def _collapse_stats(stats: Dict) -> Counter:
+    """
+    Rebuild approximate call stacks from cProfile's caller/callee edges.
+
+    cProfile only records which function called which, not whole stacks, so
+    the time of a function reached through several callers is split between
+    them in proportion to each caller's share of its cumulative time.
+    """
+    children: Dict[tuple, Dict[tuple, float]] = {}
+    for function, (_, _, _, _, callers) in stats.items():
+        for caller, edge in callers.items():
+            children.setdefault(caller, {})[function] = edge[3]  # cumulative time via this edge
+
+    stacks: Counter = Counter()
+
+    def walk(function, path: List[str], on_path: set, scale: float) -> None:
+        _, _, total_time, cumulative_time, _ = stats[function]
+        if cumulative_time * scale < 0.000001:
+            return  # below the output resolution; also bounds the walk on dense call graphs
+        path = path + [_frame_name(function)]
+        stacks[';'.join(path)] += int(total_time * scale * 1_000_000)
+        for callee, edge_time in children.get(function, {}).items():
+            if callee in on_path or callee not in stats:
+                continue
+            callee_cumulative = stats[callee][3]
+            if callee_cumulative <= 0 or edge_time <= 0:
+                continue
+            walk(callee, path, on_path | {callee}, scale * edge_time / callee_cumulative)
+
+    roots = [function for function, entry in stats.items() if not entry[4]]
+    for root in roots:
+        walk(root, [], {root}, 1.0)
+    return stacks
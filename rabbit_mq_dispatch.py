@@ -0,0 +1,192 @@
+import logging
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+from metrics import MetricsSink, NullMetrics
+
+# decode(body, properties) -> message
+Decoder = Callable[[bytes, Any], Any]
+
+
+class BatchDispatcher:
+    """
+    pika `on_message_callback` that hands deliveries to the callback in batches.
+
+    A batch is flushed when it holds `batch_size` messages or `batch_timeout_ms`
+    after its first message arrived, whichever comes first. The whole batch is
+    then acknowledged with a single `basic_ack(multiple=True)`, or nacked the
+    same way if decoding or the callback fails. Because `multiple=True` covers
+    every earlier delivery tag on the channel, the dispatcher must be the only
+    consumer on its channel.
+    """
+
+    def __init__(self, connection, callback: Callable[[List[Any]], None], decode: Decoder,
+                 batch_size: int, batch_timeout_ms: int = 100, requeue_on_failure: bool = True,
+                 metrics: Optional[MetricsSink] = None, queue_id: str = ''):
+        self.connection = connection
+        self.callback = callback
+        self.decode = decode
+        self.batch_size = batch_size
+        self.batch_timeout = batch_timeout_ms / 1000.0
+        self.requeue_on_failure = requeue_on_failure
+        self.metrics = metrics or NullMetrics()
+        self.queue_id = queue_id
+        self.logger = logging.getLogger(__name__)
+        self._channel = None
+        self._buffer: List[Tuple[int, bytes, Any]] = []  # (delivery_tag, body, properties)
+        self._timer: Optional[object] = None
+
+    def __call__(self, channel, method, properties, body) -> None:
+        self._channel = channel
+        self._buffer.append((method.delivery_tag, body, properties))
+        self.metrics.adjust_gauge('rabbitmq_prefetched_messages', 1, queue=self.queue_id)
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+        elif self._timer is None:
+            self._timer = self.connection.call_later(self.batch_timeout, self._on_timeout)
+
+    def _on_timeout(self) -> None:
+        self._timer = None
+        self.flush()
+
+    def flush(self) -> None:
+        """Deliver whatever is buffered and settle it with one ack or nack"""
+        if self._timer is not None:
+            self.connection.remove_timeout(self._timer)
+            self._timer = None
+        if not self._buffer:
+            return
+
+        batch, self._buffer = self._buffer, []
+        last_tag = batch[-1][0]
+        metrics = self.metrics
+        start = time.perf_counter()
+        try:
+            messages = [self.decode(body, properties) for _, body, properties in batch]
+            self.callback(messages)
+        except Exception as e:
+            metrics.observe('rabbitmq_callback_seconds', time.perf_counter() - start, queue=self.queue_id)
+            self.logger.error(f"Error processing batch of {len(batch)} messages: {str(e)}")
+            self._channel.basic_nack(delivery_tag=last_tag, multiple=True,
+                                     requeue=self.requeue_on_failure)
+            metrics.increment('rabbitmq_nacks_total', len(batch), queue=self.queue_id)
+        else:
+            metrics.observe('rabbitmq_callback_seconds', time.perf_counter() - start, queue=self.queue_id)
+            self._channel.basic_ack(delivery_tag=last_tag, multiple=True)
+            metrics.increment('rabbitmq_acks_total', len(batch), queue=self.queue_id)
+        metrics.adjust_gauge('rabbitmq_prefetched_messages', -len(batch), queue=self.queue_id)
+
+    def close(self) -> None:
+        """Settle the partially filled batch before the consumer goes away"""
+        if self._channel is not None and self._channel.is_open:
+            self.flush()
+
+
+class WorkerPoolDispatcher:
+    """
+    pika `on_message_callback` that runs the callback on a thread or process pool.
+
+    Messages are decoded on the connection thread and submitted to the pool.
+    Completions are marshalled back with `connection.add_callback_threadsafe`,
+    so acks (and all of the dispatcher's bookkeeping) only ever happen on the
+    connection thread. As with the inline consumer, a message is acked once
+    its callback has finished, whether or not it raised.
+
+    With an `ordering_key`, messages whose content has the same value for that
+    key are processed one after another in delivery order, while different
+    keys run in parallel. In process mode the callback must be picklable.
+    """
+
+    def __init__(self, connection, callback: Callable[[Any], None], decode: Decoder,
+                 workers: int = 4, mode: str = 'thread', ordering_key: Optional[str] = None,
+                 metrics: Optional[MetricsSink] = None, queue_id: str = ''):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f"Unknown worker mode: {mode}")
+        self.connection = connection
+        self.callback = callback
+        self.decode = decode
+        self.ordering_key = ordering_key
+        self.metrics = metrics or NullMetrics()
+        self.queue_id = queue_id
+        self.logger = logging.getLogger(__name__)
+        executor_class = ThreadPoolExecutor if mode == 'thread' else ProcessPoolExecutor
+        self._executor = executor_class(max_workers=workers)
+        # key -> deliveries waiting behind the in-flight message with that key
+        self._waiting: Dict[Any, Deque[Tuple[Any, int, Any]]] = {}
+        self._closed = False
+        self._in_flight = 0  # delivered but not yet acked, for the prefetched gauge
+
+    def __call__(self, channel, method, properties, body) -> None:
+        try:
+            message = self.decode(body, properties)
+        except Exception as e:
+            self.logger.error(f"Error decoding message: {str(e)}")
+            channel.basic_ack(delivery_tag=method.delivery_tag)
+            self.metrics.increment('rabbitmq_acks_total', queue=self.queue_id)
+            return
+        self._in_flight += 1
+        self.metrics.adjust_gauge('rabbitmq_prefetched_messages', 1, queue=self.queue_id)
+
+        key = self._key_of(message)
+        if key is not None:
+            if key in self._waiting:
+                self._waiting[key].append((channel, method.delivery_tag, message))
+                return
+            self._waiting[key] = deque()
+        self._submit(channel, method.delivery_tag, message, key)
+
+    def _key_of(self, message: Any) -> Any:
+        if self.ordering_key is None or not isinstance(message, dict):
+            return None
+        content = message.get('content')
+        if isinstance(content, dict) and self.ordering_key in content:
+            return content[self.ordering_key]
+        return message.get(self.ordering_key)
+
+    def _submit(self, channel, delivery_tag: int, message: Any, key: Any) -> None:
+        future = self._executor.submit(self.callback, message)
+        future.add_done_callback(partial(self._marshal_done, channel, delivery_tag, key,
+                                         time.perf_counter()))
+
+    def _marshal_done(self, channel, delivery_tag: int, key: Any, submitted: float,
+                      future: Future) -> None:
+        # Runs on a worker (or executor management) thread; includes time queued in the pool
+        self.metrics.observe('rabbitmq_callback_seconds', time.perf_counter() - submitted,
+                             queue=self.queue_id)
+        try:
+            self.connection.add_callback_threadsafe(
+                partial(self._on_done, channel, delivery_tag, key, future)
+            )
+        except Exception as e:
+            # Connection already closed; the broker will redeliver the message
+            self.logger.warning(f"Could not acknowledge message {delivery_tag}: {str(e)}")
+
+    def _on_done(self, channel, delivery_tag: int, key: Any, future: Future) -> None:
+        # Runs on the connection thread
+        if self._closed or future.cancelled():
+            return
+        if future.exception() is not None:
+            self.logger.error(f"Error processing message: {str(future.exception())}")
+        if channel.is_open:
+            channel.basic_ack(delivery_tag=delivery_tag)
+            self.metrics.increment('rabbitmq_acks_total', queue=self.queue_id)
+        self._in_flight -= 1
+        self.metrics.adjust_gauge('rabbitmq_prefetched_messages', -1, queue=self.queue_id)
+
+        if key is not None:
+            waiting = self._waiting[key]
+            if waiting:
+                next_channel, next_tag, next_message = waiting.popleft()
+                self._submit(next_channel, next_tag, next_message, key)
+            else:
+                del self._waiting[key]
+
+    def close(self) -> None:
+        """Stop the pool; unacknowledged messages are redelivered by the broker"""
+        self._closed = True
+        self.metrics.adjust_gauge('rabbitmq_prefetched_messages', -self._in_flight, queue=self.queue_id)
+        self._in_flight = 0
+        self._waiting.clear()
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -1,10 +1,24 @@
 import pika
-import json
 import time
-from typing import Dict, List, Any, Optional
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Any, Optional, Callable, Iterator, TypeVar, Set
 from datetime import datetime
 import logging
-from dataclasses import dataclass
+from dataclasses import dataclass, field
+from message_codec import MessageCodec
+from metrics import MetricsSink, NullMetrics
+from profiling import SamplingProfiler
+from rabbit_mq_dispatch import BatchDispatcher, WorkerPoolDispatcher
+
+T = TypeVar('T')
+
+# Errors that mean the underlying connection is gone and should be replaced
+CONNECTION_ERRORS = (pika.exceptions.AMQPConnectionError,)
+
+# Replay modes: drain the main queue into each session queue, or read an append-only stream
+REPLAY_QUEUE = 'queue'
+REPLAY_STREAM = 'stream'
 
 @dataclass
 class QueueConfig:
@@ -14,12 +28,235 @@ class QueueConfig:
     auto_delete: bool = False
     arguments: Dict = None
 
+@dataclass
+class TopicSubscription:
+    """A session queue to consume, with its own callback and consumer options"""
+    queue_id: str
+    callback: Callable
+    user_id: str
+    session_id: str
+    prefetch_count: int = 1
+    batch_size: Optional[int] = None
+    batch_timeout_ms: int = 100
+    requeue_on_failure: bool = True
+    workers: Optional[int] = None
+    worker_mode: str = 'thread'
+    ordering_key: Optional[str] = None
+    # Where to start reading in stream replay mode: 'first', 'last', 'next',
+    # a numeric offset or a datetime
+    stream_offset: Any = 'first'
+
+    @property
+    def session_queue(self) -> str:
+        return f"{self.queue_id}_sub_{self.user_id}_{self.session_id}"
+
+@dataclass
+class BatchResult:
+    """Outcome of a confirmed batch publish; indices refer to the submitted messages"""
+    acked: List[int] = field(default_factory=list)
+    nacked: List[int] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.nacked
+
+class _ConfirmTracker:
+    """
+    Maps publisher-confirm delivery tags on one channel back to message indices.
+    A message may be published more than once (queue and fanout exchange); it
+    only counts as acked once every one of its publishes has been acked.
+    """
+
+    def __init__(self):
+        self.next_tag = 1
+        self.pending: Dict[int, int] = {}  # delivery tag -> message index, in tag order
+        self.outstanding: Dict[int, int] = {}  # message index -> unconfirmed publishes
+        self.failed: Set[int] = set()
+        self.result = BatchResult()
+
+    def track(self, index: int) -> None:
+        """Record that the next publish on the channel belongs to message `index`"""
+        self.pending[self.next_tag] = index
+        self.outstanding[index] = self.outstanding.get(index, 0) + 1
+        self.next_tag += 1
+
+    def on_confirm(self, method_frame) -> None:
+        method = method_frame.method
+        nacked = isinstance(method, pika.spec.Basic.Nack)
+        if method.multiple:
+            while self.pending:
+                tag = next(iter(self.pending))
+                if tag > method.delivery_tag:
+                    break
+                self._settle(tag, nacked)
+        elif method.delivery_tag in self.pending:
+            self._settle(method.delivery_tag, nacked)
+
+    def _settle(self, tag: int, nacked: bool) -> None:
+        index = self.pending.pop(tag)
+        if nacked:
+            self.failed.add(index)
+        self.outstanding[index] -= 1
+        if self.outstanding[index] == 0:
+            del self.outstanding[index]
+            if index in self.failed:
+                self.result.nacked.append(index)
+            else:
+                self.result.acked.append(index)
+
+    def begin(self) -> BatchResult:
+        """Start collecting a new batch and return its result object"""
+        self.failed = set()
+        self.result = BatchResult()
+        return self.result
+
+    def abandon(self) -> None:
+        """Mark every unconfirmed message of the current batch as nacked"""
+        self.result.nacked.extend(self.outstanding)
+        self.pending.clear()
+        self.outstanding.clear()
+
+@dataclass
+class PooledChannel:
+    """A long-lived connection together with the channel opened on it"""
+    connection: pika.BlockingConnection
+    channel: Any
+    # Lazily opened second channel in publisher-confirm mode, used for batches
+    confirm_channel: Any = None
+    confirms: Optional[_ConfirmTracker] = None
+
+class ConnectionPool:
+    """
+    Thread-safe pool of long-lived connections, each with one open channel.
+
+    pika's BlockingConnection is not thread-safe, so an entry is only ever
+    used by the thread that acquired it. Connections are created lazily up to
+    `size`, health-checked on checkout and replaced when they have died.
+    `on_connection_lost` is called whenever a broken connection is dropped.
+    """
+
+    def __init__(self, connection_factory: Callable[[], pika.BlockingConnection],
+                 size: int = 4, acquire_timeout: Optional[float] = None,
+                 on_connection_lost: Optional[Callable[[], None]] = None):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.connection_factory = connection_factory
+        self.size = size
+        self.acquire_timeout = acquire_timeout
+        self.on_connection_lost = on_connection_lost
+        self._idle: List[PooledChannel] = []  # used as a LIFO stack to keep hot connections hot
+        self._created = 0
+        self._available = threading.Condition()
+        self._closed = False
+        self.logger = logging.getLogger(__name__)
+
+    @contextmanager
+    def acquire(self) -> Iterator[PooledChannel]:
+        """Borrow a healthy connection/channel pair for the duration of the block"""
+        pooled = self._checkout()
+        try:
+            yield pooled
+        except CONNECTION_ERRORS:
+            self._discard(pooled, broken=True)
+            raise
+        except BaseException:
+            self._checkin(pooled)
+            raise
+        else:
+            self._checkin(pooled)
+
+    def close(self) -> None:
+        """Close every idle connection and refuse further checkouts"""
+        with self._available:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._discard(pooled)
+
+    def _checkout(self) -> PooledChannel:
+        while True:
+            pooled = self._take()
+            if pooled is None:
+                return self._create()
+            if self._revive(pooled):
+                return pooled
+            self._discard(pooled, broken=True)
+
+    def _take(self) -> Optional[PooledChannel]:
+        """Return an idle entry, or None if the caller may open a new connection"""
+        deadline = None if self.acquire_timeout is None else time.monotonic() + self.acquire_timeout
+        with self._available:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Connection pool is closed")
+                if self._idle:
+                    return self._idle.pop()
+                if self._created < self.size:
+                    self._created += 1
+                    return None
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise TimeoutError(f"No RabbitMQ connection available after {self.acquire_timeout}s")
+                self._available.wait(remaining)
+
+    def _create(self) -> PooledChannel:
+        try:
+            connection = self.connection_factory()
+            return PooledChannel(connection=connection, channel=connection.channel())
+        except BaseException:
+            with self._available:
+                self._created -= 1
+                self._available.notify()
+            raise
+
+    def _revive(self, pooled: PooledChannel) -> bool:
+        """Health-check an idle entry, reopening its channel if only that was closed"""
+        if not pooled.connection.is_open:
+            return False
+        try:
+            # Services heartbeats and surfaces sockets that died while idle
+            pooled.connection.process_data_events(time_limit=0)
+            if not pooled.channel.is_open:
+                pooled.channel = pooled.connection.channel()
+        except CONNECTION_ERRORS as e:
+            self.logger.warning(f"Discarding broken pooled connection: {str(e)}")
+            return False
+        return True
+
+    def _checkin(self, pooled: PooledChannel) -> None:
+        with self._available:
+            if not self._closed and pooled.connection.is_open:
+                self._idle.append(pooled)
+                self._available.notify()
+                return
+        self._discard(pooled)
+
+    def _discard(self, pooled: PooledChannel, broken: bool = False) -> None:
+        with self._available:
+            self._created -= 1
+            self._available.notify()
+        if broken and self.on_connection_lost is not None:
+            self.on_connection_lost()
+        try:
+            if pooled.connection.is_open:
+                pooled.connection.close()
+        except Exception:
+            pass
+
 class RabbitMQManager:
     """Manager class for RabbitMQ operations"""
     
     def __init__(self, host: str = 'localhost', port: int = 5672,
                  username: str = 'guest', password: str = 'guest',
-                 virtual_host: str = '/'):
+                 virtual_host: str = '/', pool_size: int = 4,
+                 reconnect_attempts: int = 1, confirm_poll_interval: float = 0.005,
+                 codec: Optional[MessageCodec] = None, replay_mode: str = REPLAY_QUEUE,
+                 stream_arguments: Optional[Dict] = None,
+                 session_expires_ms: Optional[int] = 30 * 60 * 1000,
+                 bind_main_queue: bool = False,
+                 connection_factory: Optional[Callable[[], Any]] = None,
+                 metrics: Optional[MetricsSink] = None,
+                 profiler: Optional[SamplingProfiler] = None):
         self.credentials = pika.PlainCredentials(username, password)
         self.parameters = pika.ConnectionParameters(
             host=host,
@@ -29,95 +266,402 @@ class RabbitMQManager:
         )
         self.subscriptions: Dict[str, List[str]] = {}  # queue_id -> list of user_ids
         self.logger = logging.getLogger(__name__)
+        self.reconnect_attempts = reconnect_attempts
+        # Replaces pika.BlockingConnection, e.g. with FakeBroker.connect for offline runs
+        self.connection_factory = connection_factory
+        self.confirm_poll_interval = confirm_poll_interval  # I/O slice while waiting for confirms
+        self.codec = codec or MessageCodec()
+        # Counters and latency histograms; the default sink discards everything
+        self.metrics = metrics or NullMetrics()
+        # Samples publishes and consumer callbacks; disabled unless given a sample rate
+        self.profiler = profiler or SamplingProfiler()
+        if replay_mode not in (REPLAY_QUEUE, REPLAY_STREAM):
+            raise ValueError(f"Unknown replay mode: {replay_mode}")
+        self.replay_mode = replay_mode
+        # Extra stream queue arguments, e.g. retention via x-max-age / x-max-length-bytes
+        self.stream_arguments = stream_arguments or {}
+        # Session queues left without consumers are deleted by the broker after this long
+        self.session_expires_ms = session_expires_ms
+        # Queue mode only: bind the main storage queue to the fanout exchange so a
+        # message is published (and written to disk) once instead of twice
+        self.bind_main_queue = bind_main_queue
+        # Queues, exchanges and bindings already declared, so the hot paths can
+        # skip redundant declare round trips. Cleared whenever a connection is lost.
+        self._declared: Set[tuple] = set()
+        # The settings each queue was last declared with, so it can be redeclared identically
+        self._queue_configs: Dict[str, QueueConfig] = {}
+        # Pool threads (e.g. the async manager's executor) share both caches
+        self._declared_lock = threading.Lock()
+        self._pool = ConnectionPool(self._get_connection, size=pool_size,
+                                    on_connection_lost=self._on_connection_lost)
 
     def _get_connection(self) -> pika.BlockingConnection:
         """Create and return a new connection"""
+        if self.connection_factory is not None:
+            return self.connection_factory()
         return pika.BlockingConnection(self.parameters)
 
-    def create_queue(self, queue_config: QueueConfig) -> bool:
-        try:
-            connection = self._get_connection()
-            channel = connection.channel()
-            
-            if queue_config.arguments is None:
-                queue_config.arguments = {}
-            
-            # Remove or don't add the x-message-ttl argument to avoid message expiration
-            if 'x-message-ttl' in queue_config.arguments:
-                del queue_config.arguments['x-message-ttl']
-            
-            # Declare the main queue
+    def _with_channel(self, operation: Callable[[PooledChannel], T]) -> T:
+        """
+        Run an operation on a pooled channel.
+        If the pooled connection turns out to be dead, the operation is retried
+        on a fresh connection up to `reconnect_attempts` times.
+        """
+        attempt = 0
+        while True:
+            try:
+                with self._pool.acquire() as pooled:
+                    return operation(pooled)
+            except CONNECTION_ERRORS as e:
+                if attempt >= self.reconnect_attempts:
+                    raise
+                attempt += 1
+                self.logger.warning(f"Connection lost, reconnecting (attempt {attempt}): {str(e)}")
+
+    def close(self) -> None:
+        """Close all pooled connections"""
+        self._pool.close()
+
+    def _on_connection_lost(self) -> None:
+        self.metrics.increment('rabbitmq_reconnects_total')
+        self.invalidate_topology()
+
+    def invalidate_topology(self) -> None:
+        """Forget all cached declarations so they are redeclared on next use"""
+        with self._declared_lock:
+            self._declared.clear()
+
+    def _is_declared(self, key: tuple) -> bool:
+        with self._declared_lock:
+            return key in self._declared
+
+    def _mark_declared(self, key: tuple) -> None:
+        with self._declared_lock:
+            self._declared.add(key)
+
+    def _declare_queue(self, channel, queue_config: QueueConfig) -> None:
+        key = ('queue', queue_config.queue_id)
+        # The broker deletes x-expires queues behind the cache, so they are always redeclared
+        cache = not (queue_config.arguments and 'x-expires' in queue_config.arguments)
+        if cache:
+            with self._declared_lock:
+                self._queue_configs[queue_config.queue_id] = queue_config
+        if cache and self._is_declared(key):
+            return
+        with self.metrics.timer('rabbitmq_declare_seconds', kind='queue'):
             channel.queue_declare(
                 queue=queue_config.queue_id,
                 durable=queue_config.durable,
                 auto_delete=queue_config.auto_delete,
                 arguments=queue_config.arguments
             )
-            
-            connection.close()
+        if cache:
+            self._mark_declared(key)
+
+    def _declare_exchange(self, channel, exchange: str, exchange_type: str = 'fanout') -> None:
+        key = ('exchange', exchange)
+        if self._is_declared(key):
+            return
+        with self.metrics.timer('rabbitmq_declare_seconds', kind='exchange'):
+            channel.exchange_declare(exchange=exchange, exchange_type=exchange_type, durable=True)
+        self._mark_declared(key)
+
+    def _bind_queue(self, channel, queue: str, exchange: str, cache: bool = True) -> None:
+        """Bind once per process; pass cache=False for queues the broker may delete (x-expires)"""
+        key = ('binding', exchange, queue)
+        if cache and self._is_declared(key):
+            return
+        with self.metrics.timer('rabbitmq_declare_seconds', kind='binding'):
+            channel.queue_bind(exchange=exchange, queue=queue)
+        if cache:
+            self._mark_declared(key)
+
+    def _forget_queue(self, queue_id: str) -> None:
+        """Drop a deleted queue and its bindings from the declaration cache"""
+        with self._declared_lock:
+            self._queue_configs.pop(queue_id, None)
+            self._declared = {
+                key for key in self._declared
+                if not (key[0] == 'queue' and key[1] == queue_id)
+                and not (key[0] == 'binding' and key[2] == queue_id)
+            }
+
+    @staticmethod
+    def _stream_name(queue_id: str) -> str:
+        return f"{queue_id}_stream"
+
+    def _declare_stream(self, channel, queue_id: str) -> None:
+        """Declare the queue's replay stream and bind it to the fanout exchange"""
+        fanout = f"{queue_id}_fanout"
+        stream = self._stream_name(queue_id)
+        self._declare_exchange(channel, fanout)
+        self._declare_queue(channel, QueueConfig(
+            queue_id=stream, durable=True,
+            arguments={'x-queue-type': 'stream', **self.stream_arguments}
+        ))
+        self._bind_queue(channel, stream, fanout)
+
+    def _publish_targets(self, channel, queue_id: str) -> List[tuple]:
+        """
+        Make sure the publish topology exists and return the (exchange, routing_key)
+        pairs each message must be published to.
+        In stream mode the stream is bound to the fanout exchange, so a single
+        publish feeds both history and live subscribers. With `bind_main_queue`
+        the main queue is bound the same way.
+        """
+        fanout = f"{queue_id}_fanout"
+        if self.replay_mode == REPLAY_STREAM:
+            self._declare_stream(channel, queue_id)
+            return [(fanout, '')]
+        self._declare_exchange(channel, fanout)
+        if self.bind_main_queue:
+            # Redeclare with the caller's settings; a bare QueueConfig would fail with 406 on
+            # queues created with arguments. A queue this process never declared is only bound
+            with self._declared_lock:
+                queue_config = self._queue_configs.get(queue_id)
+            if queue_config is not None:
+                self._declare_queue(channel, queue_config)
+            self._bind_queue(channel, queue_id, fanout)
+            return [(fanout, '')]
+        return [('', queue_id), (fanout, '')]
+
+    def declare_topology(self, queue_configs: List[QueueConfig]) -> bool:
+        """
+        Declare the main queue and fanout exchange of every queue up front
+        (plus the replay stream in stream mode), so that publishing afterwards
+        only costs a basic_publish.
+        """
+        def declare(pooled: PooledChannel) -> None:
+            for queue_config in queue_configs:
+                self._declare_queue(pooled.channel, queue_config)
+                self._publish_targets(pooled.channel, queue_config.queue_id)
+
+        try:
+            for queue_config in queue_configs:
+                self._normalize_arguments(queue_config)
+            self._with_channel(declare)
+            return True
+        except Exception as e:
+            self.logger.error(f"Error declaring topology: {str(e)}")
+            return False
+
+    @staticmethod
+    def _normalize_arguments(queue_config: QueueConfig) -> None:
+        if queue_config.arguments is None:
+            queue_config.arguments = {}
+
+        # Remove or don't add the x-message-ttl argument to avoid message expiration
+        if 'x-message-ttl' in queue_config.arguments:
+            del queue_config.arguments['x-message-ttl']
+
+    def create_queue(self, queue_config: QueueConfig) -> bool:
+        try:
+            self._normalize_arguments(queue_config)
+
+            # Declare the main queue; an explicit create always goes to the broker
+            with self._declared_lock:
+                self._declared.discard(('queue', queue_config.queue_id))
+            self._with_channel(lambda pooled: self._declare_queue(pooled.channel, queue_config))
             return True
         except Exception as e:
             self.logger.error(f"Error creating queue: {str(e)}")
             return False
 
+    def _encode_message(self, message: Any, timestamp: Optional[str] = None):
+        """Wrap a message with metadata and encode it exactly once; returns (body, properties)"""
+        message_with_metadata = {
+            'content': message,
+            'timestamp': timestamp or datetime.utcnow().isoformat(),
+        }
+        encoded = self.codec.encode(message_with_metadata)
+        properties = pika.BasicProperties(
+            delivery_mode=2,  # Make message persistent
+            content_type=encoded.content_type,
+            content_encoding=encoded.content_encoding,
+        )
+        return encoded.body, properties
+
+    def _decode_message(self, body: bytes, properties) -> Any:
+        message = self.codec.decode(body, properties.content_type, properties.content_encoding)
+        # Stream deliveries carry their offset, which consumers use as a resume checkpoint
+        if properties.headers and 'x-stream-offset' in properties.headers and isinstance(message, dict):
+            message['offset'] = properties.headers['x-stream-offset']
+        return message
+
     def publish_message(self, queue_id: str, message: Any) -> bool:
+        metrics = self.metrics
+        metrics.adjust_gauge('rabbitmq_publish_in_flight', 1)
+        start = time.perf_counter()
         try:
-            connection = self._get_connection()
-            channel = connection.channel()
-            
-            message_with_metadata = {
-                'content': message,
-                'timestamp': datetime.utcnow().isoformat(),
-            }
-            
-            # Publish to main queue (ensure persistence)
-            channel.basic_publish(
-                exchange='',
-                routing_key=queue_id,
-                body=json.dumps(message_with_metadata),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,  # Make message persistent
-                )
-            )
-            
-            # Publish to fanout exchange for subscribers
-            channel.exchange_declare(exchange=f"{queue_id}_fanout", exchange_type='fanout', durable=True)
-            channel.basic_publish(
-                exchange=f"{queue_id}_fanout",
-                routing_key='',
-                body=json.dumps(message_with_metadata),
-                properties=pika.BasicProperties(
-                    delivery_mode=2,
-                )
-            )
-            
-            connection.close()
+            with self.profiler.profile(f"publish:{queue_id}"):
+                body, properties = self._encode_message(message)
+
+                def publish(pooled: PooledChannel) -> None:
+                    channel = pooled.channel
+
+                    # Main queue (persistent storage) and fanout exchange for subscribers
+                    for exchange, routing_key in self._publish_targets(channel, queue_id):
+                        channel.basic_publish(
+                            exchange=exchange,
+                            routing_key=routing_key,
+                            body=body,
+                            properties=properties
+                        )
+
+                self._with_channel(publish)
+            metrics.increment('rabbitmq_publish_total', queue=queue_id)
             return True
         except Exception as e:
             self.logger.error(f"Error publishing message: {str(e)}")
+            metrics.increment('rabbitmq_publish_failures_total', queue=queue_id)
             return False
+        finally:
+            metrics.observe('rabbitmq_publish_seconds', time.perf_counter() - start, queue=queue_id)
+            metrics.adjust_gauge('rabbitmq_publish_in_flight', -1)
+
+    def publish_batch(self, queue_id: str, messages: List[Any], confirm_window: int = 1000,
+                      timeout: float = 30.0) -> BatchResult:
+        """
+        Publish many messages over one confirm-mode channel.
 
-    def subscribe_to_queue(self, queue_id: str, user_id: str, session_id: str) -> bool:
+        Publisher confirms are collected asynchronously: up to `confirm_window`
+        publishes may be unconfirmed at a time, and the call only blocks when the
+        window is full or at the end of the batch. Messages that are nacked, or
+        still unconfirmed after `timeout` seconds, are reported as nacked.
+
+        Args:
+            queue_id: ID of the queue to publish to
+            messages: Message contents to publish
+            confirm_window: Maximum number of unconfirmed publishes in flight
+            timeout: Seconds to wait for all confirms of the batch
+
+        Returns:
+            BatchResult: indices of acked and nacked messages
+        """
+        result = BatchResult()
+        if not messages:
+            return result
+
+        timestamp = datetime.utcnow().isoformat()
+        deadline = time.monotonic() + timeout
+        start = time.perf_counter()
+        pooled = None
+        self.metrics.adjust_gauge('rabbitmq_publish_in_flight', len(messages))
+        try:
+            with self._pool.acquire() as pooled:
+                channel = self._confirm_channel(pooled)
+                tracker = pooled.confirms
+                result = tracker.begin()
+                targets = self._publish_targets(pooled.channel, queue_id)
+
+                for index, message in enumerate(messages):
+                    body, properties = self._encode_message(message, timestamp)
+                    for exchange, routing_key in targets:
+                        channel.basic_publish(exchange=exchange, routing_key=routing_key,
+                                              body=body, properties=properties)
+                        tracker.track(index)
+                    if len(tracker.pending) >= confirm_window:
+                        self._wait_for_confirms(pooled, confirm_window // 2, deadline)
+
+                self._wait_for_confirms(pooled, 0, deadline)
+        except Exception as e:
+            self.logger.error(f"Error publishing batch: {str(e)}")
+            if pooled is not None:
+                self._drop_confirm_channel(pooled)
+
+        # Anything not positively confirmed is reported as nacked
+        settled = set(result.acked) | set(result.nacked)
+        result.nacked.extend(index for index in range(len(messages)) if index not in settled)
+
+        self.metrics.adjust_gauge('rabbitmq_publish_in_flight', -len(messages))
+        self.metrics.increment('rabbitmq_publish_total', len(result.acked), queue=queue_id)
+        if result.nacked:
+            self.metrics.increment('rabbitmq_publish_failures_total', len(result.nacked), queue=queue_id)
+        self.metrics.observe('rabbitmq_publish_batch_seconds', time.perf_counter() - start, queue=queue_id)
+        return result
+
+    def _confirm_channel(self, pooled: PooledChannel):
+        """
+        Return the pooled connection's confirm-mode channel, opening it if needed.
+        Confirms are received through the underlying asynchronous channel so
+        that many publishes can be in flight at once; BlockingChannel's own
+        confirm mode waits for every publish individually.
+        """
+        if pooled.confirm_channel is not None and pooled.confirm_channel.is_open:
+            return pooled.confirm_channel._impl
+
+        channel = pooled.connection.channel()
+        tracker = _ConfirmTracker()
+        selected = []
+        channel._impl.confirm_delivery(ack_nack_callback=tracker.on_confirm,
+                                       callback=selected.append)
+        while not selected:
+            pooled.connection.process_data_events(time_limit=self.confirm_poll_interval)
+        pooled.confirm_channel = channel
+        pooled.confirms = tracker
+        return channel._impl
+
+    def _wait_for_confirms(self, pooled: PooledChannel, max_pending: int, deadline: float) -> None:
+        """Pump the connection until at most `max_pending` publishes are unconfirmed"""
+        tracker = pooled.confirms
+        while len(tracker.pending) > max_pending:
+            if time.monotonic() >= deadline:
+                self.logger.warning(f"Timed out waiting for {len(tracker.pending)} publisher confirms")
+                tracker.abandon()
+                # Late confirms would be attributed to the next batch
+                self._drop_confirm_channel(pooled)
+                return
+            pooled.connection.process_data_events(time_limit=self.confirm_poll_interval)
+
+    def _drop_confirm_channel(self, pooled: PooledChannel) -> None:
+        channel, pooled.confirm_channel, pooled.confirms = pooled.confirm_channel, None, None
+        try:
+            if channel is not None and channel.is_open:
+                channel.close()
+        except Exception:
+            pass
+
+    def subscribe_to_queue(self, queue_id: str, user_id: str, session_id: str,
+                           live_only: bool = False) -> bool:
         """
         Subscribe a user session to a queue.
         Each session gets its own exclusive queue to replay messages.
+
+        Session queues are never durable, so the broker keeps their messages in
+        memory only. With `live_only` the session skips the replay and just
+        receives messages published from now on, unless its queue has already
+        expired, in which case it is recreated and replayed after all.
+
+        In stream replay mode nothing is copied or consumed: the session later
+        reads the shared stream from its own offset (see TopicSubscription),
+        so subscribing costs the same however long the history is.
         """
-        try:
-            connection = self._get_connection()
-            channel = connection.channel()
+        def subscribe(pooled: PooledChannel) -> None:
+            channel = pooled.channel
+
+            if self.replay_mode == REPLAY_STREAM:
+                self._declare_stream(channel, queue_id)
+                return
 
             # Define the main persistent queue for storage
             main_queue = queue_id
-            channel.queue_declare(queue=main_queue, durable=True)
+            with self._declared_lock:
+                main_config = self._queue_configs.get(main_queue, QueueConfig(queue_id=main_queue))
+            self._declare_queue(channel, main_config)
 
-            # Define a unique session-specific queue (exclusive)
+            # Define a unique session-specific queue (exclusive), garbage-collected
+            # by the broker once it has been unused for session_expires_ms
             session_queue = f"{queue_id}_sub_{user_id}_{session_id}"
-            channel.queue_declare(queue=session_queue, durable=False, exclusive=False)
+            arguments = {'x-expires': self.session_expires_ms} if self.session_expires_ms else None
+            self._declare_queue(channel, QueueConfig(queue_id=session_queue, durable=False,
+                                                     arguments=arguments))
 
             # Replay all existing messages from the main queue to the session queue
-            while True:
+            while not live_only:
                 method_frame, properties, body = channel.basic_get(queue=main_queue, auto_ack=False)
                 if method_frame:
+                    # The copy only lives in a non-durable queue, so send it transient
+                    properties.delivery_mode = 1
                     channel.basic_publish(
                         exchange='',
                         routing_key=session_queue,
@@ -130,48 +674,186 @@ class RabbitMQManager:
                     break
 
             # Bind the session queue to the fanout exchange for live updates
-            channel.exchange_declare(exchange=f"{queue_id}_fanout", exchange_type='fanout', durable=True)
-            channel.queue_bind(exchange=f"{queue_id}_fanout", queue=session_queue)
+            self._declare_exchange(channel, f"{queue_id}_fanout")
+            self._bind_queue(channel, session_queue, f"{queue_id}_fanout", cache=arguments is None)
 
-            connection.close()
+        try:
+            if live_only and self.replay_mode != REPLAY_STREAM and \
+                    not self.session_queue_exists(queue_id, user_id, session_id):
+                # Messages published since it expired only remain in the main queue
+                self.logger.warning(f"Session queue for {user_id} [Session {session_id}] on {queue_id} "
+                                    f"has expired, replaying the main queue")
+                live_only = False
+            with self.metrics.timer('rabbitmq_replay_seconds', queue=queue_id):
+                self._with_channel(subscribe)
             return True
         except Exception as e:
             self.logger.error(f"Error subscribing session to queue: {str(e)}")
             return False
+
+    def session_queue_exists(self, queue_id: str, user_id: str, session_id: str) -> bool:
+        """
+        Whether a session's queue still exists on the broker, e.g. before
+        resuming it; it is gone once unused for longer than session_expires_ms.
+        """
+        session_queue = f"{queue_id}_sub_{user_id}_{session_id}"
+
+        def check(pooled: PooledChannel) -> bool:
+            # A missing queue closes the channel; the pool reopens it on next checkout
+            try:
+                pooled.channel.queue_declare(queue=session_queue, passive=True)
+                return True
+            except pika.exceptions.ChannelClosedByBroker:
+                self._forget_queue(session_queue)
+                return False
+
+        return self._with_channel(check)
     
-    def consume_messages(self, queue_id: str, callback, user_id: str, session_id: str) -> None:
+    def _message_handler(self, connection, subscription: TopicSubscription):
+        """Build the pika on_message_callback for the subscription's consumer mode"""
+        callback = subscription.callback
+        queue_id = subscription.queue_id
+        metrics = self.metrics
+        decode = self._instrumented_decoder(queue_id) if metrics.enabled else self._decode_message
+        if self.profiler.enabled and subscription.worker_mode != 'process':
+            # Process-mode callbacks must stay picklable, so only the decoder is profiled there
+            callback = self.profiler.wrap(f"consume:{queue_id}", callback)
+        decode = self.profiler.wrap(f"decode:{queue_id}", decode)
+        if subscription.batch_size and subscription.workers:
+            raise ValueError("batch_size and workers cannot be combined")
+        if subscription.workers:
+            return WorkerPoolDispatcher(connection, callback, decode,
+                                        workers=subscription.workers,
+                                        mode=subscription.worker_mode,
+                                        ordering_key=subscription.ordering_key,
+                                        metrics=metrics, queue_id=queue_id)
+        if subscription.batch_size:
+            return BatchDispatcher(connection, callback, decode, subscription.batch_size,
+                                   batch_timeout_ms=subscription.batch_timeout_ms,
+                                   requeue_on_failure=subscription.requeue_on_failure,
+                                   metrics=metrics, queue_id=queue_id)
+
+        def message_handler(ch, method, properties, body):
+            metrics.adjust_gauge('rabbitmq_prefetched_messages', 1, queue=queue_id)
+            start = time.perf_counter()
+            try:
+                message = decode(body, properties)
+                callback(message)  # Process the message
+            except Exception as e:
+                self.logger.error(f"Error processing message: {str(e)}")
+            finally:
+                metrics.observe('rabbitmq_callback_seconds', time.perf_counter() - start, queue=queue_id)
+                ch.basic_ack(delivery_tag=method.delivery_tag)  # Acknowledge after processing
+                metrics.increment('rabbitmq_acks_total', queue=queue_id)
+                metrics.adjust_gauge('rabbitmq_prefetched_messages', -1, queue=queue_id)
+
+        return message_handler
+
+    def _instrumented_decoder(self, queue_id: str) -> Callable[[bytes, Any], Any]:
+        """Decoder that also records consumer lag from the publish timestamp"""
+        def decode(body: bytes, properties) -> Any:
+            message = self._decode_message(body, properties)
+            try:
+                published = datetime.fromisoformat(message['timestamp'])
+                lag = (datetime.utcnow() - published).total_seconds()
+                self.metrics.observe('rabbitmq_consume_lag_seconds', max(lag, 0.0), queue=queue_id)
+            except (KeyError, TypeError, ValueError):
+                pass
+            return message
+
+        return decode
+
+    def consume_messages(self, queue_id: str, callback, user_id: str, session_id: str,
+                         stop_event: Optional[threading.Event] = None, prefetch_count: int = 1,
+                         batch_size: Optional[int] = None, batch_timeout_ms: int = 100,
+                         requeue_on_failure: bool = True, workers: Optional[int] = None,
+                         worker_mode: str = 'thread', ordering_key: Optional[str] = None,
+                         stream_offset: Any = 'first') -> None:
         """
         Consume messages from a user session-specific queue.
+        The consumer holds its own connection for its whole lifetime rather
+        than tying up a pooled one. If a stop_event is given, consuming ends
+        (and the connection is closed) once it is set from another thread.
+
+        Args:
+            prefetch_count: Unacknowledged messages the broker may push ahead
+            batch_size: If set, the callback receives a list of up to this many
+                messages, acked together with one `multiple=True` ack. On failure
+                the batch is nacked, and requeued if `requeue_on_failure`.
+            batch_timeout_ms: Maximum time to wait for a batch to fill up
+            workers: If set, the callback runs on a pool of this many workers
+                instead of on the connection thread
+            worker_mode: 'thread' or 'process' pool
+            ordering_key: Content field (e.g. 'order_id') whose messages must be
+                processed in sequence while other keys run in parallel
+            stream_offset: Stream replay mode only: 'first', 'last', 'next', a
+                numeric offset or a datetime to start reading from
+        """
+        self.consume_topics([TopicSubscription(
+            queue_id=queue_id, callback=callback, user_id=user_id, session_id=session_id,
+            prefetch_count=prefetch_count, batch_size=batch_size,
+            batch_timeout_ms=batch_timeout_ms, requeue_on_failure=requeue_on_failure,
+            workers=workers, worker_mode=worker_mode, ordering_key=ordering_key,
+            stream_offset=stream_offset
+        )], stop_event=stop_event)
+
+    def consume_topics(self, subscriptions: List[TopicSubscription],
+                       stop_event: Optional[threading.Event] = None) -> None:
+        """
+        Consume many session queues over one connection and one I/O loop.
+
+        Each subscription gets its own lightweight channel on the shared
+        connection, so prefetch is applied per topic and a batch consumer's
+        `multiple=True` ack cannot touch another topic's deliveries.
         """
+        connection = None
+        message_handlers = []
         try:
             connection = self._get_connection()
-            channel = connection.channel()
 
-            # Determine the session-specific queue
-            session_queue = f"{queue_id}_sub_{user_id}_{session_id}"
+            for subscription in subscriptions:
+                channel = connection.channel()
+                message_handler = self._message_handler(connection, subscription)
+                message_handlers.append(message_handler)
 
-            def message_handler(ch, method, properties, body):
-                try:
-                    message = json.loads(body)
-                    callback(message)  # Process the message
-                except Exception as e:
-                    self.logger.error(f"Error processing message: {str(e)}")
-                finally:
-                    ch.basic_ack(delivery_tag=method.delivery_tag)  # Acknowledge after processing
-
-            # Ensure we consume one message at a time
-            channel.basic_qos(prefetch_count=1)
-
-            # Start consuming
-            channel.basic_consume(
-                queue=session_queue,
-                on_message_callback=message_handler
-            )
+                # A batch can only fill up, and workers can only be kept busy, if the
+                # broker may send that many messages ahead
+                channel.basic_qos(prefetch_count=max(subscription.prefetch_count,
+                                                     subscription.batch_size or 1,
+                                                     subscription.workers or 1))
 
-            channel.start_consuming()
+                # Start consuming
+                if self.replay_mode == REPLAY_STREAM:
+                    # Every session reads the shared stream from its own offset
+                    channel.basic_consume(
+                        queue=self._stream_name(subscription.queue_id),
+                        on_message_callback=message_handler,
+                        consumer_tag=subscription.session_queue,
+                        arguments={'x-stream-offset': subscription.stream_offset}
+                    )
+                else:
+                    channel.basic_consume(
+                        queue=subscription.session_queue,
+                        on_message_callback=message_handler
+                    )
+
+            # One loop services every channel on the connection
+            while stop_event is None or not stop_event.is_set():
+                connection.process_data_events(time_limit=None if stop_event is None else 1)
 
         except Exception as e:
             self.logger.error(f"Error consuming messages: {str(e)}")
+        finally:
+            self._close_consumer(connection, message_handlers)
+
+    def _close_consumer(self, connection, message_handlers) -> None:
+        for message_handler in message_handlers:
+            try:
+                if hasattr(message_handler, 'close'):
+                    message_handler.close()
+            except Exception as e:
+                self.logger.error(f"Error closing message handler: {str(e)}")
+        if connection is not None and connection.is_open:
             connection.close()
 
 
@@ -179,25 +861,73 @@ class RabbitMQManager:
         """
         Delete the specified queue if it exists.
         """
-        try:
-            connection = self._get_connection()
-            channel = connection.channel()
+        def delete(pooled: PooledChannel) -> bool:
+            channel = pooled.channel
 
             # Check if queue exists before attempting to delete
-            queue_exists = True
+            # (a missing queue closes the channel; the pool reopens it on next checkout)
             try:
                 channel.queue_declare(queue=queue_id, passive=True)
             except pika.exceptions.ChannelClosedByBroker:
-                queue_exists = False
+                self._forget_queue(queue_id)
                 self.logger.info(f"Queue {queue_id} does not exist.")
-            
-            if queue_exists:
-                channel.queue_delete(queue=queue_id)
-                self.logger.info(f"Queue {queue_id} has been deleted.")
-            
-            connection.close()
-            return queue_exists
+                return False
 
+            channel.queue_delete(queue=queue_id)
+            self._forget_queue(queue_id)
+            self.logger.info(f"Queue {queue_id} has been deleted.")
+            return True
+
+        try:
+            return self._with_channel(delete)
         except Exception as e:
             self.logger.error(f"Error deleting queue: {str(e)}")
             return False
+
+
+class BatchPublisher:
+    """
+    Buffers messages for one queue and publishes them with `publish_batch`.
+    Use it as a context manager so the tail of the buffer is flushed on exit.
+    Messages that were nacked are kept in `failed` so they can be retried.
+    """
+
+    def __init__(self, rabbitmq_manager: RabbitMQManager, queue_id: str,
+                 batch_size: int = 500, confirm_window: int = 1000, timeout: float = 30.0):
+        self.rabbitmq_manager = rabbitmq_manager
+        self.queue_id = queue_id
+        self.batch_size = batch_size
+        self.confirm_window = confirm_window
+        self.timeout = timeout
+        self.acked_count = 0
+        self.failed: List[Any] = []
+        self._buffer: List[Any] = []
+        self._lock = threading.Lock()
+
+    def publish(self, message: Any) -> Optional[BatchResult]:
+        """Buffer a message; returns the batch result when this call triggered a flush"""
+        with self._lock:
+            self._buffer.append(message)
+            if len(self._buffer) < self.batch_size:
+                return None
+            return self._flush_locked()
+
+    def flush(self) -> BatchResult:
+        """Publish everything currently buffered and wait for its confirms"""
+        with self._lock:
+            return self._flush_locked()
+
+    def _flush_locked(self) -> BatchResult:
+        batch, self._buffer = self._buffer, []
+        result = self.rabbitmq_manager.publish_batch(
+            self.queue_id, batch, confirm_window=self.confirm_window, timeout=self.timeout
+        )
+        self.acked_count += len(result.acked)
+        self.failed.extend(batch[index] for index in sorted(result.nacked))
+        return result
+
+    def __enter__(self) -> "BatchPublisher":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.flush()
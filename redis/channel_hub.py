@@ -0,0 +1,233 @@
+# channel_hub.py
+import asyncio
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Set
+
+# What to do when a client's queue is full
+DROP_OLDEST = 'drop_oldest'  # discard the oldest queued message
+DISCONNECT = 'disconnect'  # end the client's stream; it can reconnect with its last sequence
+COALESCE = 'coalesce'  # collapse the backlog to the newest message, for clients that only need current state
+SLOW_CONSUMER_POLICIES = (DROP_OLDEST, DISCONNECT, COALESCE)
+
+
+class Subscriber:
+    """One client's bounded queue of raw messages from a channel"""
+
+    def __init__(self, channel: str, max_queue: int, policy: str, on_overflow=None):
+        self.channel = channel
+        self.max_queue = max_queue
+        self.policy = policy
+        self.on_overflow = on_overflow
+        self.closed = False
+        self.dropped = 0
+        self.feed = None  # set by ChannelHub.subscribe
+        self._queue: Deque[str] = deque()
+        self._ready = asyncio.Event()
+
+    def push(self, messages: List[str]) -> None:
+        if self.closed:
+            return
+        for message in messages:
+            if len(self._queue) >= self.max_queue:
+                if self.policy == DISCONNECT:
+                    self.close()
+                    self._overflow(len(self._queue))
+                    return
+                if self.policy == COALESCE:
+                    self._overflow(len(self._queue))
+                    self._queue.clear()
+                else:
+                    self._overflow(1)
+                    self._queue.popleft()
+            self._queue.append(message)
+        self._ready.set()
+
+    def _overflow(self, dropped: int) -> None:
+        self.dropped += dropped
+        if self.on_overflow is not None:
+            self.on_overflow(self, dropped)
+
+    async def get(self) -> List[str]:
+        """Wait for messages and return everything queued; empty once closed and drained"""
+        while not self._queue and not self.closed:
+            self._ready.clear()
+            await self._ready.wait()
+        return self.drain()
+
+    def drain(self) -> List[str]:
+        """Return everything queued without waiting"""
+        messages = list(self._queue)
+        self._queue.clear()
+        return messages
+
+    def close(self) -> None:
+        """End the stream; messages already queued are still returned by get()"""
+        self.closed = True
+        self._ready.set()
+
+
+class _ChannelFeed:
+    """The single Redis subscription for a channel and the clients it feeds"""
+
+    def __init__(self, pubsub=None):
+        self.pubsub = pubsub
+        self.subscribers: Set[Subscriber] = set()
+        self.subscribed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.error: Optional[BaseException] = None
+
+
+class ChannelHub:
+    """
+    Holds one Redis pubsub subscription per channel for the whole process and
+    fans each message out to every client's bounded queue. A slow client only
+    fills its own queue; what happens then is set by `slow_consumer_policy`.
+    The subscription is opened for the first client and closed after the last.
+
+    Instead of pubsub, a channel can be fed by a `source`: a callable returning
+    an async iterator of message lists. Its first item marks the point from
+    which everything is delivered (it may be empty), like a pubsub confirmation.
+    """
+
+    def __init__(self, redis_client, max_queue: int = 1000, slow_consumer_policy: str = DROP_OLDEST,
+                 drain_limit: int = 1000, metrics=None):
+        if slow_consumer_policy not in SLOW_CONSUMER_POLICIES:
+            raise ValueError(f"Unknown slow consumer policy: {slow_consumer_policy}")
+        self.redis_client = redis_client
+        self.max_queue = max_queue
+        self.slow_consumer_policy = slow_consumer_policy
+        self.drain_limit = drain_limit
+        self.metrics = metrics
+        self._feeds: Dict[str, _ChannelFeed] = {}
+
+    async def subscribe(self, channel: str,
+                        source: Optional[Callable[[], AsyncIterator[List[str]]]] = None) -> Subscriber:
+        """
+        Register a client on a channel. Returns once Redis has confirmed the
+        subscription, so anything published afterwards reaches the client.
+        """
+        subscriber = Subscriber(channel, self.max_queue, self.slow_consumer_policy, self._on_overflow)
+        feed = self._feeds.get(channel)
+        if feed is None:
+            if source is None:
+                feed = self._feeds[channel] = _ChannelFeed(self.redis_client.pubsub())
+                feed.task = asyncio.create_task(self._read(channel, feed))
+            else:
+                feed = self._feeds[channel] = _ChannelFeed()
+                feed.task = asyncio.create_task(self._read_source(channel, feed, source))
+        feed.subscribers.add(subscriber)
+        subscriber.feed = feed
+        self._adjust_subscribers(channel, 1)
+
+        await feed.subscribed.wait()
+        if feed.error is not None:
+            await self.unsubscribe(subscriber)
+            raise feed.error
+        return subscriber
+
+    async def unsubscribe(self, subscriber: Subscriber) -> None:
+        subscriber.close()
+        feed = subscriber.feed
+        if feed is None or subscriber not in feed.subscribers:
+            return
+        feed.subscribers.discard(subscriber)
+        self._adjust_subscribers(subscriber.channel, -1)
+        if not feed.subscribers:
+            if self._feeds.get(subscriber.channel) is feed:
+                del self._feeds[subscriber.channel]
+            await self._close_feed(feed)
+
+    def close_channel(self, channel: str) -> None:
+        """End every client stream on a channel"""
+        feed = self._feeds.get(channel)
+        if feed is not None:
+            for subscriber in list(feed.subscribers):
+                subscriber.close()
+
+    async def close(self) -> None:
+        feeds, self._feeds = list(self._feeds.values()), {}
+        for feed in feeds:
+            for subscriber in feed.subscribers:
+                subscriber.close()
+            await self._close_feed(feed)
+
+    async def _read(self, channel: str, feed: _ChannelFeed) -> None:
+        pubsub = feed.pubsub
+        try:
+            await pubsub.subscribe(channel)
+            while True:
+                messages = [await pubsub.get_message(timeout=None)]
+                while len(messages) < self.drain_limit:
+                    message = await pubsub.get_message(timeout=0)
+                    if message is None:
+                        break
+                    messages.append(message)
+
+                data = []
+                for message in messages:
+                    if message is None:
+                        continue
+                    if message['type'] == 'subscribe':
+                        feed.subscribed.set()
+                    elif message['type'] == 'message':
+                        data.append(message['data'])
+                if data:
+                    for subscriber in list(feed.subscribers):
+                        subscriber.push(data)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._fail(channel, feed, e)
+
+    async def _read_source(self, channel: str, feed: _ChannelFeed,
+                           source: Callable[[], AsyncIterator[List[str]]]) -> None:
+        try:
+            async for data in source():
+                feed.subscribed.set()
+                if data:
+                    for subscriber in list(feed.subscribers):
+                        subscriber.push(data)
+            raise ConnectionError(f"Source for channel {channel} ended")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._fail(channel, feed, e)
+
+    def _fail(self, channel: str, feed: _ChannelFeed, error: Exception) -> None:
+        """
+        Lost the subscription: end the client streams so they reconnect and resume,
+        and let the next client open a fresh subscription
+        """
+        feed.error = error
+        feed.subscribed.set()
+        if self._feeds.get(channel) is feed:
+            del self._feeds[channel]
+        for subscriber in list(feed.subscribers):
+            subscriber.close()
+
+    async def _close_feed(self, feed: _ChannelFeed) -> None:
+        if feed.task is not None and feed.task is not asyncio.current_task():
+            feed.task.cancel()
+            try:
+                await feed.task
+            except (asyncio.CancelledError, Exception):
+                pass
+        if feed.pubsub is None:
+            return
+        try:
+            await feed.pubsub.aclose()  # Unsubscribes and returns the connection to the pool
+        except Exception:
+            pass
+
+    def _on_overflow(self, subscriber: Subscriber, dropped: int) -> None:
+        if self.metrics is None:
+            return
+        if subscriber.closed:
+            self.metrics.increment('redis_hub_disconnects_total', channel=subscriber.channel)
+        else:
+            self.metrics.increment('redis_hub_dropped_total', dropped, channel=subscriber.channel,
+                                   policy=subscriber.policy)
+
+    def _adjust_subscribers(self, channel: str, delta: int) -> None:
+        if self.metrics is not None:
+            self.metrics.adjust_gauge('redis_hub_subscribers', delta, channel=channel)
@@ -0,0 +1,281 @@
+# channel_scheduler.py
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import socket
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+# Extends a lease only if this worker still holds it. KEYS: lease. ARGV: worker id, ttl ms
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Deletes a lease only if this worker holds it. KEYS: lease. ARGV: worker id
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# Moves an active channel to the stopping set. KEYS: registry, stopping set. ARGV: channel
+UNREGISTER_SCRIPT = """
+if redis.call('HDEL', KEYS[1], ARGV[1]) == 1 then
+    redis.call('SADD', KEYS[2], ARGV[1])
+    return 1
+end
+return 0
+"""
+
+REGISTRY_KEY = 'channels:active'
+STOPPING_KEY = 'channels:stopping'  # stopped channels whose history is still to be cleared
+WORKERS_KEY = 'channels:workers'
+
+
+class ChannelRegistry:
+    """
+    Cluster-wide set of active channels, kept in one Redis hash so every
+    worker and host agrees on what is running. Each channel maps to its
+    settings (storage backend, retention), which every worker applies before
+    serving it.
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self._unregister_script = redis_client.register_script(UNREGISTER_SCRIPT)
+
+    async def register(self, channel: str, config: Optional[Dict[str, Any]] = None) -> bool:
+        """Mark a channel active; False if it already was"""
+        return bool(await self.redis_client.hsetnx(REGISTRY_KEY, channel, json.dumps(config or {})))
+
+    async def unregister(self, channel: str) -> bool:
+        """Mark a channel stopped; its history is cleared once its publisher has stopped"""
+        return bool(await self._unregister_script(keys=[REGISTRY_KEY, STOPPING_KEY], args=[channel]))
+
+    async def is_stopping(self, channel: str) -> bool:
+        return bool(await self.redis_client.sismember(STOPPING_KEY, channel))
+
+    async def stopped(self, channel: str) -> None:
+        await self.redis_client.srem(STOPPING_KEY, channel)
+
+    async def get(self, channel: str) -> Optional[Dict[str, Any]]:
+        """A channel's settings, or None if it is not active"""
+        config = await self.redis_client.hget(REGISTRY_KEY, channel)
+        return json.loads(config) if config is not None else None
+
+    async def channels(self) -> Dict[str, Dict[str, Any]]:
+        return {channel: json.loads(config)
+                for channel, config in (await self.redis_client.hgetall(REGISTRY_KEY)).items()}
+
+
+class PublisherScheduler:
+    """
+    Runs exactly one publisher per active channel across every worker process
+    and host sharing a Redis.
+
+    A worker publishes a channel only while it holds the channel's lease, a
+    key set with SET NX and a TTL and renewed every `heartbeat_interval`. A
+    worker that dies stops renewing, so its leases expire and other workers
+    take the channels over within about `lease_ttl` seconds. Workers also
+    heartbeat into a shared set so each one knows how many are alive and
+    claims no more than its fair share of channels, handing extras back when
+    workers join.
+
+    A worker that stalls for longer than the lease can overlap briefly with
+    the one taking over; it stops its publisher at its next heartbeat.
+
+    A stopped channel is finished off (`on_channel_stopped`, e.g. clearing its
+    history) only after its publisher has stopped: by the lease owner once it
+    releases the lease, or by any worker when nobody holds the lease.
+    """
+
+    def __init__(self, redis_client, registry: ChannelRegistry,
+                 publisher: Callable[[str, asyncio.Event], Awaitable[None]],
+                 lease_ttl: float = 5.0, heartbeat_interval: float = 1.5,
+                 on_channel_added: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+                 on_channel_removed: Optional[Callable[[str], None]] = None,
+                 on_channel_stopped: Optional[Callable[[str], Awaitable[None]]] = None,
+                 worker_id: Optional[str] = None, metrics=None):
+        if heartbeat_interval >= lease_ttl:
+            raise ValueError("heartbeat_interval must be shorter than lease_ttl")
+        self.redis_client = redis_client
+        self.registry = registry
+        self.publisher = publisher
+        self.lease_ttl = lease_ttl
+        self.heartbeat_interval = heartbeat_interval
+        self.on_channel_added = on_channel_added
+        self.on_channel_removed = on_channel_removed
+        self.on_channel_stopped = on_channel_stopped
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.metrics = metrics
+        self.logger = logging.getLogger(__name__)
+        self._renew_script = redis_client.register_script(RENEW_SCRIPT)
+        self._release_script = redis_client.register_script(RELEASE_SCRIPT)
+        self.known: Dict[str, Dict[str, Any]] = {}  # active channels as of the last heartbeat
+        self.owned: Dict[str, asyncio.Event] = {}  # channels this worker publishes, with their stop events
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._loop_task: Optional[asyncio.Task] = None
+        self._wake = asyncio.Event()
+
+    def _lease_key(self, channel: str) -> str:
+        return f"lease:{channel}"
+
+    @property
+    def _ttl_ms(self) -> int:
+        return int(self.lease_ttl * 1000)
+
+    async def start(self) -> None:
+        if self._loop_task is None:
+            await self.tick()
+            self._loop_task = asyncio.create_task(self._run())
+
+    def wake(self) -> None:
+        """Run the next heartbeat now, e.g. right after a channel was registered"""
+        self._wake.set()
+
+    async def stop(self) -> None:
+        """Stop this worker's publishers and release their leases so others take over at once"""
+        if self._loop_task is not None:
+            self._loop_task.cancel()
+            try:
+                await self._loop_task
+            except asyncio.CancelledError:
+                pass
+            self._loop_task = None
+        for channel in list(self.owned):
+            await self._release(channel)
+        try:
+            await self.redis_client.zrem(WORKERS_KEY, self.worker_id)
+        except Exception as e:
+            self.logger.error(f"Failed to deregister worker {self.worker_id}: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.heartbeat_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Leases we fail to renew expire and are picked up elsewhere
+                self.logger.error(f"Scheduler heartbeat failed: {e}")
+
+    async def tick(self) -> None:
+        """One heartbeat: renew leases, follow the registry and claim or hand back channels"""
+        now = time.time()
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            pipe.zadd(WORKERS_KEY, {self.worker_id: now + self.lease_ttl})
+            pipe.zremrangebyscore(WORKERS_KEY, '-inf', now)
+            pipe.zcard(WORKERS_KEY)
+            pipe.hgetall(REGISTRY_KEY)
+            pipe.smembers(STOPPING_KEY)
+            _, _, workers, registered, stopping = await pipe.execute()
+        channels = {channel: json.loads(config) for channel, config in registered.items()}
+        self._sync_known(channels)
+
+        # Renew what we hold; stop anything we lost or that was stopped
+        for channel in list(self.owned):
+            if channel not in channels:
+                await self._release(channel)
+            elif self._tasks[channel].done() or not await self._renew_script(
+                    keys=[self._lease_key(channel)], args=[self.worker_id, self._ttl_ms]):
+                if not self._tasks[channel].done():
+                    self.logger.warning(f"Lost the lease on channel {channel}")
+                    self._count('redis_scheduler_leases_lost_total', channel)
+                await self._release(channel)
+
+        for channel in stopping:
+            if channel not in channels:
+                await self.finish_stop(channel)
+
+        fair_share = math.ceil(len(channels) / max(workers, 1))
+        if len(self.owned) > fair_share:
+            # Hand one channel back per heartbeat so a joining worker can claim it
+            await self._release(random.choice(list(self.owned)))
+            return
+
+        unowned = [channel for channel in channels if channel not in self.owned]
+        random.shuffle(unowned)  # Spread contention between workers claiming at the same time
+        for channel in unowned:
+            if len(self.owned) >= fair_share:
+                break
+            if await self.redis_client.set(self._lease_key(channel), self.worker_id, nx=True, px=self._ttl_ms):
+                self._launch(channel)
+
+    async def finish_stop(self, channel: str) -> bool:
+        """
+        Run `on_channel_stopped` for a stopped channel unless another worker still
+        publishes it, in which case that worker does so after stopping its publisher.
+        Returns whether the channel was finished off here.
+        """
+        if channel in self.owned:
+            await self._release(channel)
+        elif await self.redis_client.exists(self._lease_key(channel)):
+            return False
+        if self.on_channel_stopped is not None:
+            await self.on_channel_stopped(channel)
+        await self.registry.stopped(channel)
+        return True
+
+    def _sync_known(self, channels: Dict[str, Dict[str, Any]]) -> None:
+        for channel in set(self.known) - set(channels):
+            if self.on_channel_removed is not None:
+                self.on_channel_removed(channel)
+        for channel, config in channels.items():
+            if self.known.get(channel) != config and self.on_channel_added is not None:
+                self.on_channel_added(channel, config)
+        self.known = channels
+
+    def _launch(self, channel: str) -> None:
+        stop_event = asyncio.Event()
+        self.owned[channel] = stop_event
+        self._tasks[channel] = asyncio.create_task(self._publish(channel, stop_event))
+        self.logger.info(f"Worker {self.worker_id} now publishes channel {channel}")
+        self._count('redis_scheduler_leases_acquired_total', channel)
+        self._adjust_owned(1)
+
+    async def _publish(self, channel: str, stop_event: asyncio.Event) -> None:
+        try:
+            await self.publisher(channel, stop_event)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Released at the next heartbeat, when any worker may pick the channel up again
+            self.logger.error(f"Publisher for channel {channel} failed: {e}")
+
+    async def _release(self, channel: str) -> None:
+        stop_event = self.owned.pop(channel, None)
+        task = self._tasks.pop(channel, None)
+        if stop_event is None:
+            return
+        stop_event.set()
+        self._adjust_owned(-1)
+        if task is not None and not task.done():
+            try:
+                await asyncio.wait_for(task, self.heartbeat_interval)
+            except (asyncio.TimeoutError, asyncio.CancelledError, Exception):
+                pass
+        try:
+            await self._release_script(keys=[self._lease_key(channel)], args=[self.worker_id])
+        except Exception as e:
+            self.logger.error(f"Failed to release the lease on channel {channel}: {e}")
+
+    def _count(self, name: str, channel: str) -> None:
+        if self.metrics is not None:
+            self.metrics.increment(name, channel=channel)
+
+    def _adjust_owned(self, delta: int) -> None:
+        if self.metrics is not None:
+            self.metrics.adjust_gauge('redis_scheduler_channels_owned', delta)
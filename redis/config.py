@@ -1,10 +1,38 @@
 # config.py
+from typing import List, Optional
 from pydantic import BaseModel
 
 class Settings(BaseModel):
     REDIS_HOST: str = "localhost"
     REDIS_PORT: int = 6379
     REDIS_PASSWORD: str = "root"
+    # Connection pool shared by publishers and consumers (each consumer holds one connection)
+    REDIS_MAX_CONNECTIONS: int = 50
+    REDIS_POOL_TIMEOUT: Optional[float] = 5.0  # seconds to wait for a free connection
+    REDIS_SOCKET_TIMEOUT: Optional[float] = 5.0
+    REDIS_SOCKET_CONNECT_TIMEOUT: Optional[float] = 5.0
+    # Live messages queued per SSE client, and what to do when a client falls behind:
+    # "drop_oldest", "disconnect" or "coalesce" (keep only the newest message)
+    CLIENT_QUEUE_SIZE: int = 1000
+    SLOW_CONSUMER_POLICY: str = "drop_oldest"
+    # Channel storage: "zset" (sorted set + PUBLISH) or "stream" (Redis Streams)
+    REDIS_BACKEND: str = "zset"
+    REDIS_STREAM_CHANNELS: List[str] = []
+    # Default history retention per channel; unset limits are not enforced.
+    # With REDIS_ARCHIVE_TRIMMED, trimmed history goes to gzip segments in REDIS_ARCHIVE_DIR
+    REDIS_MAX_MESSAGES: Optional[int] = None
+    REDIS_MAX_AGE_SECONDS: Optional[float] = None
+    REDIS_MAX_BYTES: Optional[int] = None
+    REDIS_ARCHIVE_TRIMMED: bool = False
+    REDIS_ARCHIVE_DIR: Optional[str] = None
+    # SSE: under load, live messages are sent at most once per this many seconds,
+    # as one frame; responses are gzip/brotli compressed when the client accepts it
+    SSE_FRAME_DELAY: float = 0.005
+    SSE_COMPRESSION: bool = True
+    # Publisher leases: a channel fails over to another worker about
+    # SCHEDULER_LEASE_TTL seconds after its worker dies
+    SCHEDULER_LEASE_TTL: float = 5.0
+    SCHEDULER_HEARTBEAT_INTERVAL: float = 1.5
     API_HOST: str = "0.0.0.0"
     API_PORT: int = 8000
 
@@ -0,0 +1,56 @@
+# history_archive.py
+import gzip
+import os
+import time
+from typing import Iterator, List
+
+
+class HistoryArchive:
+    """
+    Keeps messages trimmed from Redis in gzip-compressed segment files, one
+    directory per channel and one JSON-lines segment per trim, so deep
+    history stays readable without holding it in Redis memory.
+
+    Segments are named by the time they were written; since trimming always
+    removes the oldest messages, that is also message order.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _channel_dir(self, channel: str) -> str:
+        safe = ''.join(c if c.isalnum() or c in '-_.' else '_' for c in channel)
+        return os.path.join(self.directory, safe)
+
+    def write(self, channel: str, messages: List[str]) -> str:
+        """Write one segment and return its path; blocking, run it off the event loop"""
+        channel_dir = self._channel_dir(channel)
+        os.makedirs(channel_dir, exist_ok=True)
+        path = os.path.join(channel_dir, f"{time.time_ns():020d}.jsonl.gz")
+        tmp_path = f"{path}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            for message in messages:
+                f.write(message)
+                f.write('\n')
+        os.replace(tmp_path, path)
+        return path
+
+    def segments(self, channel: str) -> List[str]:
+        """Segment paths of a channel, oldest first"""
+        channel_dir = self._channel_dir(channel)
+        if not os.path.isdir(channel_dir):
+            return []
+        return [os.path.join(channel_dir, name) for name in sorted(os.listdir(channel_dir))
+                if name.endswith('.jsonl.gz')]
+
+    def read_segment(self, path: str) -> List[str]:
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return [line.rstrip('\n') for line in f if line.strip()]
+
+    def read(self, channel: str) -> Iterator[str]:
+        for path in self.segments(channel):
+            yield from self.read_segment(path)
+
+    def delete(self, channel: str) -> None:
+        for path in self.segments(channel):
+            os.remove(path)
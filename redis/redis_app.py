@@ -1,24 +1,43 @@
 
 # app.py
+from contextlib import asynccontextmanager
 from datetime import datetime
-from fastapi import FastAPI, BackgroundTasks, Query
+from fastapi import FastAPI, Header, HTTPException, Query
 from fastapi.responses import StreamingResponse
 import asyncio
-from typing import Dict, Optional
+from dataclasses import asdict
+from typing import Any, Dict, Optional
 import uvicorn
 from config import settings
-from redis_manager import RedisManager
+from redis_manager import RedisManager, RetentionPolicy
+from metrics import PrometheusMetrics, mount_metrics
+from sse import encode_stream, negotiate_encoding
+from channel_scheduler import ChannelRegistry, PublisherScheduler
 
-app = FastAPI()
+metrics = PrometheusMetrics()
 redis_manager = RedisManager(
     host=settings.REDIS_HOST,
     port=settings.REDIS_PORT,
-    password=settings.REDIS_PASSWORD
+    password=settings.REDIS_PASSWORD,
+    metrics=metrics,
+    max_connections=settings.REDIS_MAX_CONNECTIONS,
+    pool_timeout=settings.REDIS_POOL_TIMEOUT,
+    socket_timeout=settings.REDIS_SOCKET_TIMEOUT,
+    socket_connect_timeout=settings.REDIS_SOCKET_CONNECT_TIMEOUT,
+    client_queue_size=settings.CLIENT_QUEUE_SIZE,
+    slow_consumer_policy=settings.SLOW_CONSUMER_POLICY,
+    default_backend=settings.REDIS_BACKEND,
+    stream_channels=settings.REDIS_STREAM_CHANNELS,
+    retention=RetentionPolicy(
+        max_messages=settings.REDIS_MAX_MESSAGES,
+        max_age_seconds=settings.REDIS_MAX_AGE_SECONDS,
+        max_bytes=settings.REDIS_MAX_BYTES,
+        archive=settings.REDIS_ARCHIVE_TRIMMED
+    ),
+    archive_dir=settings.REDIS_ARCHIVE_DIR,
+    frame_delay=settings.SSE_FRAME_DELAY
 )
 
-# Store background tasks and their stop events
-active_tasks: Dict[str, asyncio.Event] = {}
-
 async def message_publisher(channel: str, stop_event: asyncio.Event):
     """Example publisher function - replace with your actual message generation logic"""
     counter = 0
@@ -32,61 +51,134 @@ async def message_publisher(channel: str, stop_event: asyncio.Event):
         await redis_manager.publish_message(channel, message)
         await asyncio.sleep(1)
 
+def apply_channel_config(channel: str, config: Dict[str, Any]):
+    """Apply a channel's registered settings to this worker's manager"""
+    if config.get("backend"):
+        redis_manager.set_channel_backend(channel, config["backend"])
+    if config.get("retention"):
+        redis_manager.set_channel_retention(channel, RetentionPolicy(**config["retention"]))
+
+# Active channels are shared by every worker through Redis; each channel is
+# published by whichever worker holds its lease
+registry = ChannelRegistry(redis_manager.redis_client)
+scheduler = PublisherScheduler(
+    redis_manager.redis_client,
+    registry,
+    message_publisher,
+    lease_ttl=settings.SCHEDULER_LEASE_TTL,
+    heartbeat_interval=settings.SCHEDULER_HEARTBEAT_INTERVAL,
+    on_channel_added=apply_channel_config,
+    on_channel_removed=redis_manager.stop_streams,  # Ends this worker's streams of a stopped channel
+    on_channel_stopped=redis_manager.clear_channel,  # Runs once the channel's publisher has stopped
+    metrics=metrics
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await redis_manager.connect()
+    await scheduler.start()
+    yield
+    await scheduler.stop()
+
+app = FastAPI(lifespan=lifespan)
+# Prometheus scrape endpoint: GET /metrics
+mount_metrics(app, metrics)
+
 @app.post("/start/{channel}")
-async def start_broadcast(channel: str, background_tasks: BackgroundTasks):
-    if channel in active_tasks:
+async def start_broadcast(
+    channel: str,
+    backend: Optional[str] = Query(None, description="Storage backend: zset or stream"),
+    max_messages: Optional[int] = Query(None, description="Keep at most this many messages"),
+    max_age_seconds: Optional[float] = Query(None, description="Trim messages older than this"),
+    max_bytes: Optional[int] = Query(None, description="Keep at most this many bytes of history"),
+    archive: bool = Query(False, description="Archive trimmed history to disk instead of discarding it")
+):
+    config: Dict[str, Any] = {}
+    if backend is not None:
+        config["backend"] = backend
+    if max_messages or max_age_seconds or max_bytes:
+        config["retention"] = asdict(RetentionPolicy(
+            max_messages=max_messages,
+            max_age_seconds=max_age_seconds,
+            max_bytes=max_bytes,
+            archive=archive
+        ))
+    try:
+        apply_channel_config(channel, config)  # Validate before registering
+    except ValueError as e:
+        return {"status": "error", "message": str(e)}
+
+    if await registry.is_stopping(channel):
+        return {"status": "error", "message": "Channel is still stopping"}
+    if not await registry.register(channel, config):
         return {"status": "error", "message": "Channel already active"}
-    
-    stop_event = asyncio.Event()
-    active_tasks[channel] = stop_event
-    background_tasks.add_task(message_publisher, channel, stop_event)
+    # Claim it now if this worker has room; otherwise another worker does at its next heartbeat
+    scheduler.wake()
     return {"status": "success", "message": f"Started broadcasting on channel: {channel}"}
 
 @app.get("/consume/{channel}")
 async def consume_messages(
     channel: str,
-    last_sequence: Optional[int] = Query(None, description="Last received sequence number")
+    last_sequence: Optional[str] = Query(None, description="Last received sequence number (entry ID on stream channels)"),
+    max_replay: Optional[int] = Query(None, ge=0, description="Replay at most this many of the newest stored messages"),
+    since: Optional[datetime] = Query(None, description="Only replay messages published at or after this time (ISO 8601, UTC if no offset)"),
+    last_event_id: Optional[str] = Header(None, description="Sent by browsers when an EventSource reconnects; takes precedence over last_sequence"),
+    accept_encoding: Optional[str] = Header(None)
 ):
-    if channel not in active_tasks:
+    config = await registry.get(channel)
+    if config is None:
         return {"status": "error", "message": "Channel not active"}
-    
+    apply_channel_config(channel, config)
+
+    if last_event_id:
+        # A reconnecting EventSource resends its original URL, so the header is the newer position
+        last_sequence = last_event_id  # SSE event IDs are sequences (entry IDs on stream channels)
+    # Reject bad input now; once the stream has started the status can no longer change
+    try:
+        last_sequence = redis_manager.parse_last_sequence(channel, last_sequence)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
     stop_event = asyncio.Event()
     redis_manager.add_stream(channel, stop_event)
 
     async def stream_generator():
-        async for message in redis_manager.consume_messages(channel, last_sequence):
+        async for message in redis_manager.consume_messages(channel, last_sequence, max_replay, since):
             if stop_event.is_set():
                 break
             yield message
     
+    encoding = negotiate_encoding(accept_encoding) if settings.SSE_COMPRESSION else None
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    if settings.SSE_COMPRESSION:
+        headers["Vary"] = "Accept-Encoding"
+    if encoding is not None:
+        headers["Content-Encoding"] = encoding
     return StreamingResponse(
-        stream_generator(),
-        media_type="text/event-stream"
+        encode_stream(stream_generator(), encoding),
+        media_type="text/event-stream",
+        headers=headers
     )
 
 @app.post("/stop/{channel}")
 async def stop_broadcast(channel: str):
-    if channel not in active_tasks:
+    if not await registry.unregister(channel):
         return {"status": "error", "message": "Channel not found"}
-    
-    # Stop background task
-    stop_event = active_tasks.pop(channel)
-    stop_event.set()
 
-    # Stop active streams for the channel
+    # Stop active streams for the channel; other workers stop theirs at their next heartbeat
     redis_manager.stop_streams(channel)
 
-    # Clear Redis data
-    redis_manager.clear_channel(channel)
+    # Clear Redis data once the publisher has stopped: right away if it runs here or
+    # nowhere, otherwise its worker clears it after stopping it at its next heartbeat
+    await scheduler.finish_stop(channel)
     return {"status": "success", "message": f"Stopped broadcasting on channel: {channel}"}
 
 
 @app.post("/shutdown")
 async def shutdown():
-    for stop_event in active_tasks.values():
-        stop_event.set()
-    active_tasks.clear()
-    redis_manager.close()
+    # Hand this worker's channels over to the others right away
+    await scheduler.stop()
+    await redis_manager.close()
     return {"status": "success", "message": "Server shutting down"}
 
 if __name__ == "__main__":
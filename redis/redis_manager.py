@@ -1,21 +1,222 @@
 
 # redis_manager.py
-import redis
+import logging
+import os
+import sys
+import time
+import redis.asyncio as redis
 import asyncio
 import json
-from typing import AsyncGenerator, Any, Optional
-from datetime import datetime
+from dataclasses import dataclass
+from typing import AsyncGenerator, AsyncIterator, Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+from datetime import datetime, timedelta, timezone
+from redis.exceptions import ResponseError
+
+# metrics.py lives at the repository root, next to the RabbitMQ manager
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metrics import COUNT_BUCKETS, MetricsSink, NullMetrics
+from profiling import SamplingProfiler
+from channel_hub import ChannelHub, COALESCE, DROP_OLDEST
+from history_archive import HistoryArchive
+
+# Assigns sequence numbers, stores and publishes a burst of messages in one atomic call,
+# then trims the channel to its retention limits.
+# KEYS: messages key, sequence key, stored-bytes key.
+# ARGV: channel, max messages (0 = none), oldest timestamp kept ('' = none), max bytes
+# (0 = none), '1' to return trimmed messages for archiving, most messages trimmed per
+# call, fewest messages worth trimming, then each message's JSON with its leading '{'
+# removed, so the script can put the sequence first as json.dumps would.
+# Returns the sequence of the first message, followed by any trimmed messages.
+PUBLISH_SCRIPT = """
+local count = #ARGV - 7
+local last = redis.call('INCRBY', KEYS[2], count)
+local first = last - count + 1
+local added = 0
+for i = 1, count do
+    local sequence = first + i - 1
+    local payload = '{"sequence": ' .. string.format('%d', sequence) .. ', ' .. ARGV[i + 7]
+    redis.call('ZADD', KEYS[1], sequence, payload)
+    redis.call('PUBLISH', ARGV[1], payload)
+    added = added + #payload
+end
+redis.call('INCRBY', KEYS[3], added)
+
+local max_messages = tonumber(ARGV[2])
+local cutoff = ARGV[3]
+local max_bytes = tonumber(ARGV[4])
+local archive = ARGV[5] == '1'
+local budget = tonumber(ARGV[6])
+local min_trim = tonumber(ARGV[7])
+local result = {first}
+
+-- Remove the n oldest messages, keeping the stored-bytes counter in step
+local function trim(n)
+    n = math.min(n, budget)
+    if n <= 0 then return end
+    local removed = redis.call('ZRANGE', KEYS[1], 0, n - 1)
+    local size = 0
+    for _, member in ipairs(removed) do
+        size = size + #member
+        if archive then result[#result + 1] = member end
+    end
+    redis.call('ZREMRANGEBYRANK', KEYS[1], 0, n - 1)
+    redis.call('DECRBY', KEYS[3], size)
+    budget = budget - n
+end
+
+if max_messages > 0 then
+    local excess = redis.call('ZCARD', KEYS[1]) - max_messages
+    if excess >= min_trim then trim(excess) end
+end
+if cutoff ~= '' then
+    -- ISO timestamps compare correctly as strings
+    local function expired_at(member)
+        local timestamp = string.match(member, '"timestamp": "([^"]*)"')
+        return timestamp ~= nil and timestamp < cutoff
+    end
+    while budget > 0 do
+        -- Probe one member before scanning a window: nothing is trimmed until
+        -- min_trim messages have expired, which is true only if the
+        -- min_trim-th oldest has, so most publishes stop here
+        local probe = redis.call('ZRANGE', KEYS[1], math.max(min_trim, 1) - 1, math.max(min_trim, 1) - 1)
+        if #probe == 0 or not expired_at(probe[1]) then break end
+        local oldest = redis.call('ZRANGE', KEYS[1], 0, math.min(budget, 100) - 1)
+        local expired = 0
+        for _, member in ipairs(oldest) do
+            if not expired_at(member) then break end
+            expired = expired + 1
+        end
+        if expired < min_trim then break end
+        trim(expired)
+        if expired < #oldest then break end
+    end
+end
+if max_bytes > 0 then
+    while budget > 0 do
+        local excess = tonumber(redis.call('GET', KEYS[3]) or '0') - max_bytes
+        if excess <= 0 then break end
+        local oldest = redis.call('ZRANGE', KEYS[1], 0, math.min(budget, 100) - 1)
+        if #oldest == 0 then break end
+        local n, freed = 0, 0
+        for _, member in ipairs(oldest) do
+            n = n + 1
+            freed = freed + #member
+            if freed >= excess then break end
+        end
+        if n < min_trim and freed >= excess then break end
+        trim(n)
+    end
+end
+return result
+"""
+
+# Most live messages drained from a subscription per wakeup, so a flood cannot starve the loop
+DRAIN_LIMIT = 1000
+
+# Storage backends, selectable per channel:
+# a sorted set plus a sequence counter with live delivery over PUBLISH,
+# or a Redis Stream read with XRANGE and tailed with blocking XREAD
+BACKEND_ZSET = 'zset'
+BACKEND_STREAM = 'stream'
+
+# Stored messages fetched per round trip when replaying history to a client
+REPLAY_PAGE_SIZE = 500
+
+# Highest sequence part of a stream entry ID
+STREAM_MAX_SEQUENCE = 2 ** 64 - 1
+
+# How long one blocking XREAD waits; must stay below the socket timeout
+STREAM_BLOCK_MS = 1000
+
+# Most messages trimmed by one publish, so catching up after a limit is lowered
+# never blocks Redis for long; later publishes continue where it stopped
+TRIM_LIMIT = 1000
+
+# When archiving, trim in runs of at least this many messages rather than one per
+# publish, so each archive segment holds a useful amount of history
+ARCHIVE_MIN_TRIM = 100
+
+# A message's position: its sequence (sorted set) or its entry ID as (ms, seq) (stream)
+Position = Union[int, Tuple[int, int]]
+
+@dataclass
+class RetentionPolicy:
+    """
+    How much history a channel keeps. Any limit left as None is not enforced.
+    With `archive`, trimmed messages are written to the manager's archive
+    directory instead of being discarded.
+    """
+    max_messages: Optional[int] = None
+    max_age_seconds: Optional[float] = None
+    max_bytes: Optional[int] = None
+    archive: bool = False
+
 
 class RedisManager:
-    def __init__(self, host: str, port: int, password: str):
-        self.redis_client = redis.StrictRedis(
-            host=host, 
-            port=port, 
-            password=password, 
-            decode_responses=True
+    """
+    Async Redis manager. All commands go through a bounded connection pool;
+    when every connection is busy, callers wait up to `pool_timeout` seconds
+    for one instead of opening more. Live messages come from a ChannelHub, which
+    holds one pubsub connection per channel however many clients consume it.
+    """
+
+    def __init__(self, host: str, port: int, password: str, metrics: Optional[MetricsSink] = None,
+                 profiler: Optional[SamplingProfiler] = None, max_connections: int = 50,
+                 socket_timeout: Optional[float] = 5.0, socket_connect_timeout: Optional[float] = 5.0,
+                 pool_timeout: Optional[float] = 5.0, client_queue_size: int = 1000,
+                 slow_consumer_policy: str = DROP_OLDEST, default_backend: str = BACKEND_ZSET,
+                 stream_channels: Iterable[str] = (), retention: Optional[RetentionPolicy] = None,
+                 archive_dir: Optional[str] = None, frame_delay: float = 0.0):
+        self.pool = redis.BlockingConnectionPool(
+            host=host,
+            port=port,
+            password=password,
+            decode_responses=True,
+            max_connections=max_connections,
+            timeout=pool_timeout,
+            socket_timeout=socket_timeout,
+            socket_connect_timeout=socket_connect_timeout
         )
-        self._validate_connection()
+        self.redis_client = redis.Redis(connection_pool=self.pool)
+        self.logger = logging.getLogger(__name__)
+        self.metrics = metrics or NullMetrics()
+        self.metrics.set_buckets('redis_frame_messages', COUNT_BUCKETS)
+        self.profiler = profiler or SamplingProfiler()
+        self._publish_script = self.redis_client.register_script(PUBLISH_SCRIPT)
+        self.hub = ChannelHub(self.redis_client, max_queue=client_queue_size,
+                              slow_consumer_policy=slow_consumer_policy, drain_limit=DRAIN_LIMIT,
+                              metrics=self.metrics)
         self.active_streams = {}  # Track active streams by channel
+        self._check_backend(default_backend)
+        self.default_backend = default_backend
+        self.channel_backends: Dict[str, str] = {channel: BACKEND_STREAM for channel in stream_channels}
+        self._groups: Set[Tuple[str, str]] = set()  # consumer groups known to exist
+        self.default_retention = retention or RetentionPolicy()
+        self.channel_retention: Dict[str, RetentionPolicy] = {}
+        self.archive = HistoryArchive(archive_dir) if archive_dir else None
+        self.frame_delay = frame_delay
+
+    @staticmethod
+    def _check_backend(backend: str) -> None:
+        if backend not in (BACKEND_ZSET, BACKEND_STREAM):
+            raise ValueError(f"Unknown storage backend: {backend}")
+
+    def set_channel_backend(self, channel: str, backend: str) -> None:
+        """Store a channel in a sorted set ('zset') or a Redis Stream ('stream')"""
+        self._check_backend(backend)
+        self.channel_backends[channel] = backend
+
+    def _backend(self, channel: str) -> str:
+        return self.channel_backends.get(channel, self.default_backend)
+
+    def set_channel_retention(self, channel: str, policy: RetentionPolicy) -> None:
+        """Limit how much history a channel keeps; enforced on each publish"""
+        if policy.archive and self.archive is None:
+            raise ValueError("Archiving trimmed history needs an archive_dir")
+        self.channel_retention[channel] = policy
+
+    def _retention(self, channel: str) -> RetentionPolicy:
+        return self.channel_retention.get(channel, self.default_retention)
 
     def add_stream(self, channel: str, stop_event: asyncio.Event):
         """Track active streams for a channel."""
@@ -29,11 +230,14 @@ class RedisManager:
             for stop_event in self.active_streams[channel]:
                 stop_event.set()
             del self.active_streams[channel]
+        # Wake streams that are idle waiting for a message
+        self.hub.close_channel(channel)
         
-    def _validate_connection(self) -> None:
+    async def connect(self) -> None:
+        """Check that Redis is reachable; call once at startup"""
         try:
-            self.redis_client.ping()
-            print("Redis connection successful!")
+            await self.redis_client.ping()
+            self.logger.info("Redis connection successful!")
         except Exception as e:
             raise ConnectionError(f"Failed to connect to Redis: {e}")
 
@@ -43,59 +247,452 @@ class RedisManager:
     def _get_sequence_key(self, channel: str) -> str:
         return f"sequence:{channel}"
 
-    async def publish_message(self, channel: str, message: Any) -> None:
-        """Publish a message with sequence number for ordered delivery"""
-        sequence = self.redis_client.incr(self._get_sequence_key(channel))
-        message_data = {
-            'sequence': sequence,
-            'timestamp': datetime.utcnow().isoformat(),
-            'data': message
-        }
-        
-        # Store in sorted set for ordered retrieval
-        message_str = json.dumps(message_data)
-        self.redis_client.zadd(self._get_message_key(channel), {message_str: sequence})
-        self.redis_client.publish(channel, message_str)
-
-    async def consume_messages(self, channel: str, last_sequence: Optional[int] = None) -> AsyncGenerator[str, None]:
-        """Consume messages with guaranteed ordering and no message loss"""
-        pubsub = self.redis_client.pubsub()
-        pubsub.subscribe(channel)
-        
+    def _get_stream_key(self, channel: str) -> str:
+        return f"stream:{channel}"
+
+    def _get_bytes_key(self, channel: str) -> str:
+        return f"bytes:{channel}"
+
+    async def publish_message(self, channel: str, message: Any) -> Union[int, str]:
+        """
+        Publish a message with sequence number for ordered delivery; returns the sequence
+        (the entry ID on stream channels)
+        """
+        return (await self.publish_batch(channel, [message]))[0]
+
+    async def publish_batch(self, channel: str, messages: List[Any]) -> List[Union[int, str]]:
+        """
+        Publish a burst of messages in one round trip.
+        On sorted-set channels a server-side script assigns consecutive sequence
+        numbers, stores every message and publishes it, atomically. On stream
+        channels the messages are appended with XADD in one MULTI.
+        Returns the sequence number (or entry ID) assigned to each message.
+
+        The channel's retention policy is enforced in the same call: sorted sets
+        are trimmed by the script, streams with an approximate XADD MAXLEN and
+        XTRIM MINID, which Redis applies only when a whole node can be freed.
+        """
+        if not messages:
+            return []
+        start = time.perf_counter()
+        now = datetime.utcnow()
+        timestamp = now.isoformat()
+        policy = self._retention(channel)
+        archive = policy.archive and self.archive is not None
         try:
-            # Get the current maximum sequence
-            message_key = self._get_message_key(channel)
-            
-            # If no last_sequence provided, start from the beginning
-            start_sequence = last_sequence if last_sequence is not None else 0
-            
-            # First yield all stored messages from the requested sequence
-            stored_messages = self.redis_client.zrangebyscore(
-                message_key,
-                start_sequence + 1,
-                '+inf'
+            # Encoded without the sequence, which is only known once stored
+            bodies = [json.dumps({'timestamp': timestamp, 'data': message})[1:] for message in messages]
+            if self._backend(channel) == BACKEND_STREAM:
+                key = self._get_stream_key(channel)
+                maxlen = self._stream_maxlen(policy, bodies)
+                minid = None
+                if policy.max_age_seconds:
+                    minid = f"{int((time.time() - policy.max_age_seconds) * 1000)}-0"
+                async with self.redis_client.pipeline(transaction=True) as pipe:
+                    for body in bodies:
+                        # When archiving, trimming happens afterwards so the entries can be read first
+                        pipe.xadd(key, {'message': body}, maxlen=None if archive else maxlen, approximate=True)
+                    if minid and not archive:
+                        pipe.xtrim(key, minid=minid, approximate=True)
+                    results = await pipe.execute()
+                positions = results[:len(bodies)]
+                if archive and (maxlen or minid):
+                    await self._archive_stream(channel, maxlen, minid)
+            else:
+                cutoff = ''
+                if policy.max_age_seconds:
+                    cutoff = (now - timedelta(seconds=policy.max_age_seconds)).isoformat()
+                first, *trimmed = await self._publish_script(
+                    keys=[self._get_message_key(channel), self._get_sequence_key(channel),
+                          self._get_bytes_key(channel)],
+                    args=[channel, policy.max_messages or 0, cutoff, policy.max_bytes or 0,
+                          '1' if archive else '0', TRIM_LIMIT, ARCHIVE_MIN_TRIM if archive else 1, *bodies]
+                )
+                positions = list(range(first, first + len(messages)))
+                if trimmed:
+                    await self._archive_messages(channel, trimmed)
+        except Exception:
+            self.metrics.increment('redis_publish_failures_total', len(messages), channel=channel)
+            raise
+        self.metrics.increment('redis_publish_total', len(messages), channel=channel)
+        self.metrics.observe('redis_publish_seconds', time.perf_counter() - start, channel=channel)
+        return positions
+
+    @staticmethod
+    def _stream_maxlen(policy: RetentionPolicy, bodies: List[str]) -> Optional[int]:
+        """
+        Entry count that keeps a stream within the policy. Streams have no byte
+        limit of their own, so max_bytes is turned into a count using the size
+        of the messages being published.
+        """
+        maxlen = policy.max_messages or None
+        if policy.max_bytes:
+            average = sum(len(body) for body in bodies) / len(bodies)
+            by_bytes = max(1, int(policy.max_bytes // average))
+            maxlen = min(maxlen, by_bytes) if maxlen else by_bytes
+        return maxlen
+
+    async def _archive_stream(self, channel: str, maxlen: Optional[int], minid: Optional[str]) -> None:
+        """Move the entries beyond a stream's limits into the archive, then trim them"""
+        key = self._get_stream_key(channel)
+        entries = []
+        if maxlen:
+            excess = await self.redis_client.xlen(key) - maxlen
+            if excess >= ARCHIVE_MIN_TRIM:
+                entries = await self.redis_client.xrange(key, count=min(excess, TRIM_LIMIT))
+        if minid:
+            expired = await self.redis_client.xrange(key, max=f"({minid}", count=TRIM_LIMIT)
+            if len(expired) >= ARCHIVE_MIN_TRIM and len(expired) > len(entries):
+                entries = expired  # Both are runs of the oldest entries; keep the longer one
+        if not entries:
+            return
+        await self._archive_messages(channel, [self._stream_payload(entry_id, fields)
+                                               for entry_id, fields in entries])
+        milliseconds, sequence = self._parse_stream_id(entries[-1][0])
+        await self.redis_client.xtrim(key, minid=f"{milliseconds}-{sequence + 1}", approximate=False)
+
+    async def _archive_messages(self, channel: str, messages: List[str]) -> None:
+        await asyncio.to_thread(self.archive.write, channel, messages)
+        self.metrics.increment('redis_archived_messages_total', len(messages), channel=channel)
+
+    async def read_archive(self, channel: str,
+                           last_sequence: Union[int, str, None] = None) -> AsyncGenerator[str, None]:
+        """
+        Archived messages of a channel after last_sequence, oldest first. Segments
+        are read one at a time off the event loop. Two publishers trimming at once
+        can archive the same messages twice; those are skipped here.
+        """
+        if self.archive is None:
+            return
+        if self._backend(channel) == BACKEND_STREAM:
+            delivered: Position = self._parse_stream_id(last_sequence) or (0, 0)
+        else:
+            delivered = int(last_sequence or 0)
+        for path in await asyncio.to_thread(self.archive.segments, channel):
+            for message in await asyncio.to_thread(self.archive.read_segment, path):
+                position = self._position_of(message)
+                if position > delivered:
+                    delivered = position
+                    yield message
+
+    @staticmethod
+    def _position_of(message: str) -> Position:
+        """Read the sequence (or entry ID) from a stored message without decoding the whole payload"""
+        prefix = '{"sequence": '
+        end = message.find(',', len(prefix)) if message.startswith(prefix) else -1
+        value = message[len(prefix):end] if end != -1 else json.dumps(json.loads(message)['sequence'])
+        if value.startswith('"'):
+            milliseconds, sequence = value.strip('"').split('-')
+            return int(milliseconds), int(sequence)
+        return int(value)
+
+    @staticmethod
+    def _sse_event(message: str) -> str:
+        """An SSE frame for a stored message, with its sequence (or entry ID) as the event ID"""
+        prefix = '{"sequence": '
+        end = message.find(',', len(prefix)) if message.startswith(prefix) else -1
+        if end == -1:
+            return f"data: {message}\n\n"
+        event_id = message[len(prefix):end].strip('"')
+        return f"id: {event_id}\ndata: {message}\n\n"
+
+    @staticmethod
+    def _stream_payload(entry_id: str, fields: Dict[str, str]) -> str:
+        """Rebuild the message JSON from a stream entry, with the entry ID as its sequence"""
+        return f'{{"sequence": "{entry_id}", {fields["message"]}'
+
+    def parse_last_sequence(self, channel: str, value: Optional[str]) -> Union[int, str, None]:
+        """
+        Validate a client-supplied last sequence for the channel's backend: a
+        non-negative integer on sorted-set channels, an entry ID ('ms' or 'ms-seq')
+        on stream channels. Raises ValueError for anything else.
+        """
+        if value is None or value == '':
+            return None
+        if self._backend(channel) == BACKEND_STREAM:
+            milliseconds, separator, sequence = value.partition('-')
+            if not milliseconds.isdigit() or (separator and not sequence.isdigit()):
+                raise ValueError(f"Invalid stream entry ID: {value}")
+            return value
+        if not value.isdigit():
+            raise ValueError(f"Invalid sequence number: {value}")
+        return int(value)
+
+    @staticmethod
+    def _parse_stream_id(last_sequence: Union[int, str, None]) -> Optional[Tuple[int, int]]:
+        if last_sequence in (None, 0, '0', ''):
+            return None
+        milliseconds, _, sequence = str(last_sequence).partition('-')
+        return int(milliseconds), int(sequence or 0)
+
+    @staticmethod
+    def _stream_id_before(entry_id: str) -> Tuple[int, int]:
+        """The position just before an entry ID, to use as an exclusive lower bound"""
+        milliseconds, _, sequence = entry_id.partition('-')
+        if int(sequence):
+            return int(milliseconds), int(sequence) - 1
+        return int(milliseconds) - 1, STREAM_MAX_SEQUENCE
+
+    async def _replay_range(self, channel: str, last_sequence: Union[int, str, None],
+                            max_replay: Optional[int] = None,
+                            since: Optional[datetime] = None) -> Tuple[Position, Position]:
+        """
+        Resolve what to replay: the position to start after and the last stored
+        position when the replay starts. Anything published later arrives live.
+        `max_replay` keeps only the newest messages of the range, `since` skips
+        messages published before that time (naive datetimes are UTC).
+        """
+        if since is not None and since.tzinfo is not None:
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+
+        if self._backend(channel) == BACKEND_STREAM:
+            key = self._get_stream_key(channel)
+            after = self._parse_stream_id(last_sequence) or (0, 0)
+            latest = await self.redis_client.xrevrange(key, count=1)
+            bound = self._parse_stream_id(latest[0][0]) if latest else after
+            if since is not None:
+                milliseconds = int(since.replace(tzinfo=timezone.utc).timestamp() * 1000)
+                after = max(after, (milliseconds - 1, STREAM_MAX_SEQUENCE))
+            if max_replay is not None and bound > after:
+                # Walk back from the end a page at a time to find where the newest max_replay begin
+                upper, remaining, oldest = f"{bound[0]}-{bound[1]}", max_replay, None
+                while remaining > 0:
+                    entries = await self.redis_client.xrevrange(
+                        key, max=upper, min=f"({after[0]}-{after[1]}", count=min(remaining, REPLAY_PAGE_SIZE))
+                    if not entries:
+                        break
+                    oldest = entries[-1][0]
+                    remaining -= len(entries)
+                    upper = f"({oldest}"
+                if remaining <= 0:
+                    after = self._stream_id_before(oldest) if oldest else bound
+            return after, bound
+
+        # If no last_sequence provided, start from the beginning
+        after = int(last_sequence) if last_sequence is not None else 0
+        bound = int(await self.redis_client.get(self._get_sequence_key(channel)) or 0)
+        if bound < after:
+            # A lower counter means the channel was cleared
+            return bound, bound
+        if max_replay is not None:
+            after = max(after, bound - max_replay)  # Sequences are consecutive
+        if since is not None and bound > after:
+            after = await self._sequence_before(channel, after, bound, since.isoformat())
+        return after, bound
+
+    async def _sequence_before(self, channel: str, after: int, bound: int, since: str) -> int:
+        """Binary search a sorted-set channel for the last sequence published before `since`"""
+        key = self._get_message_key(channel)
+        async with self.redis_client.pipeline(transaction=True) as pipe:
+            pipe.zcount(key, '-inf', after)
+            pipe.zcount(key, '-inf', bound)
+            low, high = await pipe.execute()
+        # Find the lowest rank in [low, high) published at or after `since`
+        while low < high:
+            middle = (low + high) // 2
+            members = await self.redis_client.zrange(key, middle, middle)
+            if not members:
+                high = middle
+                continue
+            timestamp = json.loads(members[0]).get('timestamp', '')
+            if timestamp >= since:
+                high = middle
+            else:
+                low = middle + 1
+        members = await self.redis_client.zrange(key, low, low)
+        if not members:
+            return bound
+        return max(after, self._position_of(members[0]) - 1)
+
+    async def _replay_page(self, channel: str, after: Position, bound: Position) -> List[str]:
+        """Up to REPLAY_PAGE_SIZE stored messages after `after`, up to and including `bound`"""
+        if self._backend(channel) == BACKEND_STREAM:
+            entries = await self.redis_client.xrange(
+                self._get_stream_key(channel),
+                min=f"({after[0]}-{after[1]}",
+                max=f"{bound[0]}-{bound[1]}",
+                count=REPLAY_PAGE_SIZE
             )
+            return [self._stream_payload(entry_id, fields) for entry_id, fields in entries]
+        return await self.redis_client.zrangebyscore(
+            self._get_message_key(channel), f"({after}", bound, start=0, num=REPLAY_PAGE_SIZE)
+
+    async def _replay_pages(self, channel: str, after: Position, bound: Position) -> AsyncIterator[List[str]]:
+        """
+        Stored messages in (after, bound], a page at a time. The next page is
+        fetched while the caller is still writing out the current one.
+        """
+        if bound <= after:
+            return
+        next_page = asyncio.create_task(self._replay_page(channel, after, bound))
+        try:
+            while next_page is not None:
+                page = await next_page
+                next_page = None
+                if not page:
+                    break
+                last = self._position_of(page[-1])
+                if len(page) == REPLAY_PAGE_SIZE and last < bound:
+                    next_page = asyncio.create_task(self._replay_page(channel, last, bound))
+                yield page
+        finally:
+            if next_page is not None:
+                next_page.cancel()
+
+    async def _fetch_between(self, channel: str, after: Position, before: Position) -> List[str]:
+        """Stored messages strictly between two positions, to fill a gap in the live stream"""
+        if self._backend(channel) == BACKEND_STREAM:
+            entries = await self.redis_client.xrange(
+                self._get_stream_key(channel),
+                min=f"({after[0]}-{after[1]}",
+                max=f"({before[0]}-{before[1]}"
+            )
+            return [self._stream_payload(entry_id, fields) for entry_id, fields in entries]
+        return await self.redis_client.zrangebyscore(self._get_message_key(channel), after + 1, before - 1)
+
+    async def _tail_stream(self, channel: str) -> AsyncIterator[List[str]]:
+        """Live source for a stream channel in the hub: everything appended after the current end"""
+        key = self._get_stream_key(channel)
+        latest = await self.redis_client.xrevrange(key, count=1)
+        last_id = latest[0][0] if latest else '0-0'
+        yield []  # Positioned: anything appended from now on is delivered
+        while True:
+            response = await self.redis_client.xread({key: last_id}, count=DRAIN_LIMIT, block=STREAM_BLOCK_MS)
+            batch = []
+            for _, entries in response or []:
+                for entry_id, fields in entries:
+                    batch.append(self._stream_payload(entry_id, fields))
+                    last_id = entry_id
+            yield batch
+
+    async def consume_messages(self, channel: str, last_sequence: Union[int, str, None] = None,
+                               max_replay: Optional[int] = None,
+                               since: Optional[datetime] = None) -> AsyncGenerator[str, None]:
+        """
+        Consume messages with guaranteed ordering and no message loss.
+
+        Live messages are buffered from before the replay starts, so nothing
+        published during the replay is missed. Messages are delivered strictly
+        in sequence order: anything at or below the last delivered sequence is
+        a duplicate and is dropped, and a gap (e.g. messages a slow client
+        dropped from its queue) is filled in from storage. With the coalesce
+        policy gaps are left as they are, since skipping is the point.
+
+        Stored history is replayed a page at a time, so memory use and time to
+        the first message do not grow with the backlog. `max_replay` limits the
+        replay to the newest messages and `since` to those published after a
+        given time; messages skipped this way are not filled in later.
+
+        On stream channels `last_sequence` is the last entry ID received.
+        """
+        source = (lambda: self._tail_stream(channel)) if self._backend(channel) == BACKEND_STREAM else None
+        subscriber = await self.hub.subscribe(channel, source=source)
+        self.metrics.adjust_gauge('redis_consumers', 1, channel=channel)
+        fill_gaps = subscriber.policy != COALESCE
+        seen_dropped = 0
+        
+        try:
+            # First yield the stored messages from the requested sequence, one page per chunk
+            replay_start = time.perf_counter()
+            delivered, bound = await self._replay_range(channel, last_sequence, max_replay, since)
+            first_page = True
+            async for page in self._replay_pages(channel, delivered, bound):
+                if first_page:
+                    # Time to first byte of the replay
+                    self.metrics.observe('redis_replay_seconds', time.perf_counter() - replay_start, channel=channel)
+                    first_page = False
+                # As for live delivery, only the synchronous work is profiled
+                with self.profiler.profile(f"replay:{channel}"):
+                    self.metrics.increment('redis_replayed_messages_total', len(page), channel=channel)
+                    delivered = self._position_of(page[-1])
+                    chunk = ''.join(self._sse_event(message) for message in page)
+                yield chunk
             
-            for message in stored_messages:
-                yield f"data: {message}\n\n"
-            
-            # Then continue with new messages
+            # Then continue with new messages, sending everything queued since the last wakeup as one chunk
+            loop = asyncio.get_running_loop()
+            last_flush = 0.0
             while True:
-                message = pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
-                if message and message['type'] == 'message':
-                    yield f"data: {message['data']}\n\n"
-                await asyncio.sleep(0.1)
+                messages = await subscriber.get()
+                if not messages:
+                    break  # Closed: channel stopped, or this client fell too far behind
+                if self.frame_delay > 0:
+                    # Under load, hold the frame until frame_delay after the previous one so
+                    # everything arriving meanwhile goes out in one write; a message after a
+                    # quiet spell is still sent at once
+                    wait = last_flush + self.frame_delay - loop.time()
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                        messages += subscriber.drain()
+
+                # Stream entry IDs are not contiguous, so a gap shows up as dropped messages
+                gap = subscriber.dropped != seen_dropped
+                seen_dropped = subscriber.dropped
+                events = []
+                for message in messages:
+                    position = self._position_of(message)
+                    if position <= delivered:
+                        self.metrics.increment('redis_duplicates_dropped_total', channel=channel)
+                        continue
+                    missing = position > delivered + 1 if isinstance(position, int) else gap
+                    if fill_gaps and missing:
+                        events.extend(await self._fetch_between(channel, delivered, position))
+                        self.metrics.increment('redis_gap_fills_total', channel=channel)
+                    gap = False
+                    events.append(message)
+                    delivered = position
+
+                if not events:
+                    continue
+                # Only the synchronous work is profiled; a sample never spans an await
+                with self.profiler.profile(f"consume:{channel}"):
+                    chunk = ''.join(self._sse_event(message) for message in events)
+                    self.metrics.increment('redis_delivered_messages_total', len(events), channel=channel)
+                    self.metrics.observe('redis_frame_messages', len(events), channel=channel)
+                last_flush = loop.time()
+                yield chunk
                 
         finally:
-            pubsub.unsubscribe(channel)
-            print(f"Unsubscribed from channel: {channel}")
-
-    def clear_channel(self, channel: str) -> None:
-        """Clear all messages and sequence for a channel"""
-        self.redis_client.delete(self._get_message_key(channel))
-        self.redis_client.delete(self._get_sequence_key(channel))
-
-    def close(self) -> None:
-        """Close Redis connection"""
-        self.redis_client.close()
-        print("Redis connection closed.")
+            self.metrics.adjust_gauge('redis_consumers', -1, channel=channel)
+            await self.hub.unsubscribe(subscriber)
+            self.logger.debug(f"Unsubscribed from channel: {channel}")
+
+    async def read_group(self, channel: str, group: str, consumer: str, count: int = 100,
+                         block_ms: int = STREAM_BLOCK_MS) -> List[Tuple[str, str]]:
+        """
+        Read new entries of a stream channel as `consumer` in a consumer group, so
+        that each entry is handled by only one member of the group. The group is
+        created on first use. Returns (entry_id, message) pairs; acknowledge them
+        with `ack` once processed.
+        """
+        key = self._get_stream_key(channel)
+        if (key, group) not in self._groups:
+            try:
+                await self.redis_client.xgroup_create(key, group, id='0', mkstream=True)
+            except ResponseError as e:
+                if 'BUSYGROUP' not in str(e):
+                    raise
+            self._groups.add((key, group))
+        response = await self.redis_client.xreadgroup(group, consumer, {key: '>'}, count=count, block=block_ms)
+        return [(entry_id, self._stream_payload(entry_id, fields))
+                for _, entries in response or [] for entry_id, fields in entries]
+
+    async def ack(self, channel: str, group: str, entry_ids: List[str]) -> int:
+        """Acknowledge entries read with `read_group`"""
+        if not entry_ids:
+            return 0
+        return await self.redis_client.xack(self._get_stream_key(channel), group, *entry_ids)
+
+    async def clear_channel(self, channel: str) -> None:
+        """Clear all messages and sequence for a channel, including its archived history"""
+        await self.redis_client.delete(self._get_message_key(channel), self._get_sequence_key(channel),
+                                       self._get_stream_key(channel), self._get_bytes_key(channel))
+        self._groups = {(key, group) for key, group in self._groups if key != self._get_stream_key(channel)}
+        if self.archive is not None:
+            await asyncio.to_thread(self.archive.delete, channel)
+
+    async def close(self) -> None:
+        """Close Redis connections"""
+        await self.hub.close()
+        await self.redis_client.aclose()
+        await self.pool.disconnect()
+        self.logger.info("Redis connection closed.")
@@ -0,0 +1,75 @@
+# sse.py
+import zlib
+from typing import AsyncGenerator, AsyncIterator, Callable, Optional, Tuple
+
+# Optional brotli support, used when installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content encodings we can stream, most preferred first
+GZIP = 'gzip'
+BROTLI = 'br'
+
+
+def supported_encodings():
+    return [BROTLI, GZIP] if brotli is not None else [GZIP]
+
+
+def negotiate_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """
+    Pick a content encoding from an Accept-Encoding header, preferring brotli
+    over gzip. Returns None when the client accepts neither.
+    """
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in supported_encodings():
+        quality = accepted.get(encoding, accepted.get('*', 0.0))
+        if quality > 0:
+            return encoding
+    return None
+
+
+def _stream_compressor(encoding: str) -> Tuple[Callable[[bytes], bytes], Callable[[], bytes]]:
+    """
+    A function compressing one chunk and flushing it, so each chunk reaches the
+    client whole, and one returning the end of the compressed stream
+    """
+    if encoding == BROTLI:
+        compressor = brotli.Compressor()
+        return lambda data: compressor.process(data) + compressor.flush(), compressor.finish
+    compressor = zlib.compressobj(wbits=31)  # gzip container
+    return (lambda data: compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH),
+            lambda: compressor.flush(zlib.Z_FINISH))
+
+
+async def encode_stream(chunks: AsyncGenerator[str, None], encoding: Optional[str] = None) -> AsyncIterator[bytes]:
+    """
+    Encode SSE chunks as UTF-8, compressed with `encoding` if given. The
+    compressor keeps its window across chunks, so repeated field names in
+    later frames compress well, while every chunk is still flushed at once.
+    """
+    if encoding is None:
+        compress = finish = None
+    else:
+        compress, finish = _stream_compressor(encoding)
+    try:
+        async for chunk in chunks:
+            data = chunk.encode('utf-8')
+            yield compress(data) if compress is not None else data
+        if finish is not None:
+            yield finish()  # gzip trailer, so strict decoders accept a stream that ended normally
+    finally:
+        await chunks.aclose()  # Release the client's subscription as soon as the response ends
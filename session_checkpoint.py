@@ -0,0 +1,68 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+
+class SessionCheckpointStore:
+    """
+    Persists consumer sessions in a local JSON file so a restarted consumer
+    can resume its session (and, in stream replay mode, its last processed
+    offset) instead of starting a new one.
+
+    Writes go through a temporary file and an atomic rename. With the default
+    `flush_interval` of 0 every save writes the file, which puts a file write
+    and rename on the consumer path for every message. Above zero, checkpoints
+    are written at most that often (and on close), trading a little
+    redelivery after a crash for fewer writes.
+    """
+
+    def __init__(self, path: str = '.rabbitmq_sessions.json', flush_interval: float = 0.0):
+        self.path = path
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._sessions: Dict[str, Dict[str, Any]] = self._read()
+        self._dirty = False
+        self._last_flush = 0.0
+
+    @staticmethod
+    def _key(queue_id: str, user_id: str) -> str:
+        return f"{queue_id}:{user_id}"
+
+    def _read(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def load(self, queue_id: str, user_id: str) -> Optional[Dict[str, Any]]:
+        """Return the saved {'session_id', 'offset'} for a consumer, if any"""
+        with self._lock:
+            saved = self._sessions.get(self._key(queue_id, user_id))
+            return dict(saved) if saved else None
+
+    def save(self, queue_id: str, user_id: str, session_id: str, offset: Optional[int] = None) -> None:
+        """Record the session and the last processed offset"""
+        with self._lock:
+            self._sessions[self._key(queue_id, user_id)] = {'session_id': session_id, 'offset': offset}
+            self._dirty = True
+            if time.monotonic() - self._last_flush >= self.flush_interval:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        with self._lock:
+            if self._dirty:
+                self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._sessions, f)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        self._last_flush = time.monotonic()
+
+    def close(self) -> None:
+        self.flush()